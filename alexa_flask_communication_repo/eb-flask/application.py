@@ -1,7 +1,11 @@
-import config
+import auth_client
 import handler
-import json
-import requests
+import json_codec
+import metrics
+import responses
+import threading
+import time
+import warmup
 from flask import Flask,request, Response, render_template, redirect
 
 
@@ -10,6 +14,9 @@ application = Flask(__name__)
 application.debug=True
 application.secret_key = 'cC1YCIWOj9GgWspgNEo2DDDD'
 
+# Build the static Alexa responses and open SuiteCRM connections before (or while) serving the first requests.
+warmup.start()
+
 
 @application.route('/', methods=['GET', 'POST'])
 def index():
@@ -18,22 +25,55 @@ def index():
     :return: JSON-formatted response required by alexa skill interface
 
     """
+    started = time.perf_counter()
+    request_type = 'unknown'
     try:
-        event = json.loads(request.get_data())
+        with metrics.span('parse'):
+            event = json_codec.loads(request.get_data())
         token_data = event.get("session").get("user")
         if event:
-            if event['session']['new']:
-                handler.on_session_started({'requestId': event['request']['requestId']},
-                                           event['session'])
-            if event['request']['type'] == "LaunchRequest":
-                res = handler.on_launch(event['request'], event['session'])
-            elif event['request']['type'] == "IntentRequest":
-                res = handler.on_intent(event['request'], event['session'],token_data)
-            elif event['request']['type'] == "SessionEndedRequest":
-                res = handler.on_session_ended(event['request'], event['session'])
+            request_type = event['request']['type']
+            with metrics.span('dispatch'):
+                if event['session']['new']:
+                    handler.on_session_started({'requestId': event['request']['requestId']},
+                                               event['session'])
+                if event['request']['type'] == "LaunchRequest":
+                    res = handler.on_launch(event['request'], event['session'])
+                elif event['request']['type'] == "IntentRequest":
+                    res = handler.on_intent(event['request'], event['session'],token_data)
+                elif event['request']['type'] == "SessionEndedRequest":
+                    res = handler.on_session_ended(event['request'], event['session'])
     except Exception as e:
+        handler.ALEXA_REQUEST_ERRORS.inc(request_type)
         res = "Sorry for interruption. You can call other APIs "
-    return Response(json.dumps(res), status=200, mimetype='application/json')
+    with metrics.span('serialize'):
+        body = responses.serialize(res)
+    handler.ALEXA_REQUEST_SECONDS.observe(request_type, time.perf_counter() - started)
+    return Response(body, status=200, mimetype='application/json')
+
+
+@application.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Request counts, latency histograms and cache/pool counters in the Prometheus text format.
+    """
+    return Response(metrics.render_prometheus(), status=200, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+_login_page = None
+_login_page_lock = threading.Lock()
+
+
+def login_page():
+    """
+    Login form of the account linking flow, rendered on first use and then served as cached bytes.
+    """
+    global _login_page
+    if _login_page is None:
+        with _login_page_lock:
+            if _login_page is None:
+                _login_page = render_template('login_template.html').encode('utf-8')
+    return Response(_login_page, status=200, mimetype='text/html')
 
 
 @application.route('/login', methods=['POST', 'GET'])
@@ -44,29 +84,15 @@ def login():
     if request.method == 'POST':
         args = request.args
         dict_args = args.to_dict(flat=False)
-        url = config.SUITE_CRM_INSTANCE_OAUTH_URL
-        header = {
-            "Content-Type": "application/vnd.api+json",
-            "Accept": "application/vnd.api+json"
-        }
-        payload = {
-            "grant_type": "password",
-            "client_id": str(dict_args.get("client_id")[0]) ,
-            # Write here client_secret created in SuiteCRM portal under Oauth keys and client.
-            "client_secret": "client_secret",
-            "username": request.form['user_name'] ,
-            "password":request.form['user_password'],
-            "scope":str(dict_args.get("scope")[0])
-
-        }
         try:
-            result = requests.post(url, data=json.dumps(payload), headers=header)
-            oauth_result_json = json.loads(result.text)
+            oauth_result_json = auth_client.password_grant(request.form['user_name'], request.form['user_password'],
+                                                           str(dict_args.get("client_id")[0]),
+                                                           str(dict_args.get("scope")[0]))
             redirect_uri = str(dict_args.get("redirect_uri")[0])+"#state="+str(dict_args.get("state")[0])+"&access_token=" +str(oauth_result_json.get("access_token")+"&token_type=Bearer")
             return redirect(redirect_uri,code=200)
         except Exception as e:
-            render_template('login_template.html')
-    return render_template('login_template.html')
+            return login_page()
+    return login_page()
 
 
 if __name__ == '__main__':
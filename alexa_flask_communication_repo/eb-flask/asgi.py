@@ -0,0 +1,67 @@
+"""
+ASGI entry point serving the Alexa endpoint with the asyncio dispatcher.
+
+Run it with any ASGI server, e.g. `uvicorn asgi:application`. The WSGI `application` in application.py
+keeps serving the same endpoint (and the /login page) for deployments that don't need it.
+"""
+import async_handler
+import metrics
+import responses
+
+
+PROMETHEUS_CONTENT_TYPE = b'text/plain; version=0.0.4; charset=utf-8'
+
+
+async def _read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _send_response(send, status, body, content_type=b'application/json'):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await async_handler.warm_up()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_handler.close_session()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """
+    ASGI application. Alexa requests are POSTed to '/', exactly like the WSGI index() route.
+    """
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    request_data = await _read_body(receive)
+    if scope['path'] == '/metrics' and scope['method'] == 'GET':
+        return await _send_response(send, 200, metrics.render_prometheus(), PROMETHEUS_CONTENT_TYPE)
+    if scope['path'] != '/':
+        return await _send_response(send, 404, b'Not Found', b'text/plain')
+    if scope['method'] not in ('GET', 'POST'):
+        return await _send_response(send, 405, b'Method Not Allowed', b'text/plain')
+    res = await async_handler.handle_event(request_data)
+    with metrics.span('serialize'):
+        body = responses.serialize(res)
+    await _send_response(send, 200, body)
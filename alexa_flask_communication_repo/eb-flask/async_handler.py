@@ -0,0 +1,411 @@
+"""
+asyncio variant of the skill dispatcher in handler.py.
+
+Only the functions waiting on SuiteCRM are reimplemented here; URL building, caching, formatting and
+response building are shared with handler.py so both entry points answer identically. SuiteCRM is called
+through aiohttp when it is installed, otherwise the blocking client is run in the default executor.
+"""
+import asyncio
+import circuit_breaker
+import config
+import contextvars
+import deadline
+import functools
+import handler
+import json_codec
+import metrics
+import session_store
+import singleflight
+import suitecrm_client
+import time
+import tokens
+import warmup
+import write_batcher
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+if aiohttp is not None:
+    UNAVAILABLE_ERRORS = suitecrm_client.UNAVAILABLE_ERRORS + (aiohttp.ClientError, asyncio.TimeoutError)
+else:
+    UNAVAILABLE_ERRORS = suitecrm_client.UNAVAILABLE_ERRORS
+
+
+_session = None
+_session_loop = None
+
+
+def _get_event_loop():
+    try:
+        return asyncio.get_running_loop()
+    except AttributeError:
+        # Python < 3.7
+        return asyncio.get_event_loop()
+
+
+def get_session():
+    """
+    Return the aiohttp session of the running event loop, creating it on first use.
+
+    The connector keeps up to config.SUITE_CRM_ASYNC_POOL_LIMIT connections alive so hundreds of
+    CRM calls can be in flight from a single process.
+    """
+    global _session, _session_loop
+    loop = _get_event_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(limit=config.SUITE_CRM_ASYNC_POOL_LIMIT,
+                                         limit_per_host=config.SUITE_CRM_ASYNC_POOL_LIMIT_PER_HOST)
+        timeout = aiohttp.ClientTimeout(connect=config.SUITE_CRM_CONNECT_TIMEOUT,
+                                        sock_read=config.SUITE_CRM_READ_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        _session_loop = loop
+    return _session
+
+
+async def preconnect(url, count):
+    """
+    Open up to `count` connections of the aiohttp session to the host of url, with concurrent HEAD requests.
+
+    :return: number of connections opened.
+    """
+    session = get_session()
+    timeout = aiohttp.ClientTimeout(total=config.SUITE_CRM_CONNECT_TIMEOUT)
+
+    async def connect():
+        try:
+            async with session.head(url, timeout=timeout) as response:
+                await response.read()
+            return 1
+        except Exception:
+            return 0
+
+    return sum(await asyncio.gather(*[connect() for _ in range(count)]))
+
+
+async def _warm_up():
+    if aiohttp is None:
+        # Without aiohttp SuiteCRM is called through the requests pool, which warmup.warm_up() fills.
+        return await _get_event_loop().run_in_executor(None, warmup.warm_up)
+    report = await _get_event_loop().run_in_executor(None, warmup.warm_up, 0)
+    report["connections"] = await preconnect(config.SUITE_CRM_INSTANCE_BASE_URL, config.WARM_UP_CONNECTIONS)
+    warmup.update_report(connections=report["connections"])
+    return report
+
+
+async def warm_up(mode=None):
+    """
+    Event loop counterpart of warmup.start(): the blocking work runs in an executor and the connections opened
+    are those of the aiohttp session.
+
+    :return: the warm-up task in "background" mode, None otherwise.
+    """
+    mode = mode or config.WARM_UP_MODE
+    if mode == "off":
+        return None
+    task = asyncio.ensure_future(_warm_up())
+    if mode == "background":
+        return task
+    await task
+    return None
+
+
+async def close_session():
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+def _request_timeout():
+    """
+    aiohttp timeout of one SuiteCRM call: the session's timeouts, with a total capped at the time left
+    for the current Alexa request unless it doesn't cap its calls (see deadline.call_timeout).
+    """
+    time_left = deadline.remaining()
+    if time_left is None:
+        return None
+    if time_left <= 0:
+        raise deadline.DeadlineExceeded("No time left to call SuiteCRM")
+    if not deadline.caps_calls():
+        return None
+    return aiohttp.ClientTimeout(total=time_left, connect=config.SUITE_CRM_CONNECT_TIMEOUT,
+                                 sock_read=config.SUITE_CRM_READ_TIMEOUT)
+
+
+async def _send(method, url, header, request_post_body=None):
+    data = json_codec.dumps(request_post_body) if request_post_body is not None else None
+    request_options = {}
+    timeout = _request_timeout()
+    if timeout is not None:
+        request_options['timeout'] = timeout
+    breaker = circuit_breaker.get_breaker(suitecrm_client.endpoint_module(url))
+    breaker.check()
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        async with get_session().request(method, url, headers=header, data=data, **request_options) as suitecrm_response:
+            status = str(suitecrm_response.status)
+            result = json_codec.loads(await suitecrm_response.read())
+    except BaseException as e:
+        # Cancellation included: an allowed call that records nothing would leave a half open circuit stuck.
+        # Calls cut short by the request deadline say nothing about SuiteCRM and only release the breaker.
+        if isinstance(e, (asyncio.TimeoutError, asyncio.CancelledError, aiohttp.ClientError)) and \
+                deadline.caps_calls() and deadline.expired():
+            breaker.release()
+        else:
+            breaker.record_failure()
+        raise
+    finally:
+        suitecrm_client.record_call(method, url, status, time.perf_counter() - started)
+    if suitecrm_response.status >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return result
+
+
+async def fetch_listing(url, header, column_list, cache_entry=None):
+    """
+    Awaitable counterpart of handler.fetch_listing.
+    """
+    try:
+        if cache_entry is None:
+            return await fetch_suitecrm_list(url, header, column_list)
+        time_left = deadline.remaining()
+        if time_left is not None and time_left < config.SUITE_CRM_MIN_FETCH_BUDGET:
+            raise deadline.DeadlineExceeded("Not enough time left to fetch the listing")
+        output_response = await fetch_suitecrm_list(url, header, column_list)
+    except UNAVAILABLE_ERRORS as e:
+        if cache_entry is None:
+            return handler.uncached_listing_error_text(e)
+        return handler.degraded_listing(url, header, column_list, cache_entry, e)
+    if isinstance(output_response, list):
+        cache_key, cache_ttl, cache_tag = cache_entry
+        handler.suitecrm_list_cache.set(cache_key, output_response, cache_ttl, tags=[cache_tag])
+    return output_response
+
+
+suitecrm_reads = singleflight.AsyncSingleFlight()
+metrics.gauges('suitecrm_async_read_coalescing', 'SuiteCRM listing GETs of the event loop sent and coalesced into '
+               'one in flight.', 'stat', suitecrm_reads.stats)
+
+
+async def get_suitecrm_list(url, header, column_list):
+    suitecrm_data = await _send('GET', url, header)
+    return handler.parse_suitecrm_list(suitecrm_data, column_list)
+
+
+async def fetch_suitecrm_list(url, header, column_list):
+    """
+    Awaitable counterpart of handler.fetch_suitecrm_list, coalescing identical GETs of the event loop.
+    """
+    try:
+        return await suitecrm_reads.do(handler.read_key(url, header, column_list), get_suitecrm_list,
+                                       url, header, column_list, timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        raise deadline.DeadlineExceeded("No time left to wait for the listing")
+
+
+async def call_suitecrm_api(url,request_type, header_authorization_token, column_list=[],module_name=False,request_post_body={}):
+    """
+    Awaitable counterpart of handler.call_suitecrm_api, sharing its read cache.
+
+    :return: JSON object containing response from API call.
+    """
+    if aiohttp is None:
+        return await _get_event_loop().run_in_executor(None, functools.partial(
+            contextvars.copy_context().run, handler.call_suitecrm_api, url, request_type, header_authorization_token,
+            column_list=column_list, module_name=module_name, request_post_body=request_post_body))
+    header = handler.suitecrm_headers(header_authorization_token)
+    if request_type == 'GET':
+        url, column_list, module_name = handler.listing_request(url, column_list, module_name)
+        cache_entry = handler.list_cache_entry(url, header_authorization_token, column_list, module_name)
+        if cache_entry is None:
+            return await fetch_listing(url, header, column_list)
+        output_response = handler.suitecrm_list_cache.get(cache_entry[0])
+        if output_response is None:
+            output_response = await fetch_listing(url, header, column_list, cache_entry)
+        return output_response
+    elif request_type in ('POST', 'PATCH'):
+        return await _send(request_type, url, header, request_post_body)
+
+
+async def get_leads(intent, token_data, page_number=1):
+    suitecrm_lead_data = await call_suitecrm_api(handler.leads_query(page_number), 'GET', token_data)
+    if getattr(suitecrm_lead_data, 'next_url', None):
+        handler.prefetch_page(handler.leads_query(page_number + 1), token_data)
+    return handler.leads_response(intent, suitecrm_lead_data, page_number)
+
+
+async def get_meetings(intent, token_data, page_number=1, requested_date=None):
+    if requested_date is None:
+        requested_date = handler.meeting_date(intent)
+    suitecrm_meeting_data = await call_suitecrm_api(handler.meetings_query(requested_date, page_number), 'GET',
+                                                    token_data)
+    if getattr(suitecrm_meeting_data, 'next_url', None):
+        handler.prefetch_page(handler.meetings_query(requested_date, page_number + 1), token_data)
+    return handler.meetings_response(intent, suitecrm_meeting_data, page_number, requested_date)
+
+
+async def get_briefing(intent, token_data):
+    """
+    Awaitable counterpart of handler.get_briefing, running the SuiteCRM calls concurrently on the event loop.
+    """
+    requested_date = handler.meeting_date(intent) or time.strftime('%Y-%m-%d')
+    suitecrm_results = await asyncio.gather(*[
+        call_suitecrm_api(query, 'GET', token_data) for section, query in handler.briefing_queries(requested_date)])
+    return handler.briefing_response(intent, suitecrm_results)
+
+
+@handler.router.async_intent("SugarCrmLeadRequestIntent")
+async def handle_lead_request(intent_request, session, token_data):
+    return await get_leads(intent_request['intent'], token_data.get("accessToken"))
+
+
+@handler.router.async_intent("SugarCrmGetMeetingIntent")
+async def handle_get_meeting(intent_request, session, token_data):
+    return await get_meetings(intent_request['intent'], token_data.get("accessToken"))
+
+
+@handler.router.async_intent("SugarCrmBriefingIntent")
+async def handle_briefing(intent_request, session, token_data):
+    return await get_briefing(intent_request['intent'], token_data.get("accessToken"))
+
+
+@handler.router.async_intent("SugarCrmNextPageIntent", "AMAZON.NextIntent")
+async def handle_next_page(intent_request, session, token_data):
+    cursor = handler.next_page_cursor(session)
+    if cursor is None:
+        return handler.get_no_more_results_response()
+    if cursor.get("intent") == "SugarCrmLeadRequestIntent":
+        return await get_leads(intent_request['intent'], token_data.get("accessToken"), cursor.get("page", 1))
+    elif cursor.get("intent") == "SugarCrmGetMeetingIntent":
+        return await get_meetings(intent_request['intent'], token_data.get("accessToken"), cursor.get("page", 1),
+                                  cursor.get("date") or "")
+    return handler.get_no_more_results_response()
+
+
+async def post_request_details(intent,intent_dialogState,param_list,url,header_authorization_token,module_name,merge_datetime,
+                               session=None):
+    """
+    Awaitable counterpart of handler.post_request_details.
+    """
+    if intent_dialogState != "COMPLETED" or intent.get("confirmationStatus") != "CONFIRMED":
+        # Dialog delegation and cancellation never reach SuiteCRM.
+        return handler.post_request_details(intent, intent_dialogState, param_list, url,
+                                            header_authorization_token, module_name, merge_datetime, session)
+    remembered_slots = session_store.remembered_slots(session, intent.get("name"))
+    session_store.forget_slots(session, intent.get("name"))
+    param_key_val_dict = handler.collect_slot_values(intent, param_list, merge_datetime, remembered_slots)
+    user_db_id = handler.session_subject(session, header_authorization_token)
+    try:
+        if config.SUITE_CRM_WRITE_BATCHING:
+            if not tokens.is_verified(header_authorization_token):
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, functools.partial(
+                    contextvars.copy_context().run, tokens.verify, header_authorization_token,
+                    handler.token_check_url(module_name)))
+            future = write_batcher.submit_create(module_name, param_key_val_dict, user_db_id)
+            try:
+                # Shielded: cancelling the wait must not cancel the create, which its batch sends anyway.
+                result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                                handler.batched_create_timeout())
+            except asyncio.TimeoutError:
+                raise write_batcher.CreatePending("Batched create still queued at the deadline")
+        else:
+            request_body = handler.create_request_body(module_name, param_key_val_dict, user_db_id)
+            result = await call_suitecrm_api(url, 'POST', header_authorization_token, request_post_body=request_body)
+        error_response = handler.creation_error_response(intent, result)
+        if error_response is not None:
+            return error_response
+        handler.invalidate_list_cache(header_authorization_token, module_name)
+        if handler.assignment_pending(result, user_db_id):
+            changed_url, request_body = handler.assign_user_request(result, user_db_id)
+            if config.SUITE_CRM_ASSIGNMENT_MODE == "sequential":
+                await call_suitecrm_api(changed_url, 'PATCH', header_authorization_token, request_post_body=request_body)
+            else:
+                handler.schedule_assignment(changed_url, header_authorization_token, request_body)
+        return handler.statement(intent.get("name"), "Succesfully created", should_end_session=False)
+    except write_batcher.CreatePending:
+        return handler.statement(intent.get("name"), handler.SUITE_CRM_CREATE_PENDING_TEXT)
+    except tokens.TokenRejected:
+        return handler.get_link_account_response()
+    except Exception as e:
+        return handler.statement(intent.get("name"), "Inside try Your request is been cancelled")
+
+
+async def on_session_started(session_started_request, session):
+    return handler.on_session_started(session_started_request, session)
+
+
+async def on_launch(launch_request, session):
+    return handler.on_launch(launch_request, session)
+
+
+@handler.router.async_intent("SugarCrmPostLeadIntent")
+async def post_lead(intent_request, session, token_data):
+    return await post_request_details(intent_request['intent'], intent_request.get("dialogState"),
+                                      handler.LEAD_POST_PARAMS, handler.module_url('Leads'),
+                                      token_data.get("accessToken"), 'Leads', False, session)
+
+
+@handler.router.async_intent("SugarCrmPostMeetingIntent")
+async def post_meeting(intent_request, session, token_data):
+    return await post_request_details(intent_request['intent'], intent_request.get("dialogState"),
+                                      handler.MEETING_POST_PARAMS, handler.module_url('Meetings'),
+                                      token_data.get("accessToken"), 'Meetings', True, session)
+
+
+async def on_intent(intent_request, session,token_data={}):
+    """ Called when the user specifies an intent for this skill """
+    intent_name = intent_request['intent']['name']
+
+    expired_response = handler.expired_token_response(intent_name, token_data.get("accessToken"), session)
+    if expired_response is not None:
+        return expired_response
+
+    route = handler.router.route(intent_name)
+    deadline_token = deadline.set_deadline(handler.intent_deadline(intent_request),
+                                           caps_calls=route is None or not route.mutating)
+    try:
+        return await handler.router.dispatch_async(intent_request, session, token_data)
+    finally:
+        deadline.reset_deadline(deadline_token)
+
+
+async def on_session_ended(session_ended_request, session):
+    return handler.on_session_ended(session_ended_request, session)
+
+
+async def handle_event(request_data):
+    """
+    Async counterpart of application.index(): dispatch one raw Alexa request body.
+
+    :param request_data: raw JSON body of the Alexa request
+    :return: response object required by alexa skill interface
+    """
+    started = time.perf_counter()
+    request_type = 'unknown'
+    try:
+        with metrics.span('parse'):
+            event = json_codec.loads(request_data)
+        token_data = event.get("session").get("user")
+        if event:
+            request_type = event['request']['type']
+            with metrics.span('dispatch'):
+                if event['session']['new']:
+                    await on_session_started({'requestId': event['request']['requestId']}, event['session'])
+                if event['request']['type'] == "LaunchRequest":
+                    res = await on_launch(event['request'], event['session'])
+                elif event['request']['type'] == "IntentRequest":
+                    res = await on_intent(event['request'], event['session'], token_data)
+                elif event['request']['type'] == "SessionEndedRequest":
+                    res = await on_session_ended(event['request'], event['session'])
+    except Exception as e:
+        handler.ALEXA_REQUEST_ERRORS.inc(request_type)
+        res = "Sorry for interruption. You can call other APIs "
+    handler.ALEXA_REQUEST_SECONDS.observe(request_type, time.perf_counter() - started)
+    return res
@@ -0,0 +1,63 @@
+"""
+Client of SuiteCRM's OAuth2 token endpoint, used by the /login page of the account linking flow.
+
+Token requests go through the pooled SuiteCRM session with their own timeout. Identical exchanges already
+in flight (same username, password and client_id, e.g. a user submitting the login form twice during a
+login storm) are sent to SuiteCRM only once.
+"""
+import config
+import hashlib
+import json_codec
+import metrics
+import singleflight
+import suitecrm_client
+
+
+OAUTH_HEADERS = {
+    "Content-Type": "application/vnd.api+json",
+    "Accept": "application/vnd.api+json"
+}
+
+_exchanges = singleflight.SingleFlight()
+
+
+def exchange_key(username, password, client_id):
+    # The password is part of the key so a wrong password never gets the token of a concurrent right one.
+    return (username, client_id, hashlib.sha256(password.encode('utf-8')).hexdigest())
+
+
+def _post_token_request(payload):
+    suitecrm_response = suitecrm_client.post(config.SUITE_CRM_INSTANCE_OAUTH_URL, data=json_codec.dumps(payload),
+                                             headers=OAUTH_HEADERS,
+                                             timeout=(config.SUITE_CRM_CONNECT_TIMEOUT,
+                                                      config.SUITE_CRM_OAUTH_READ_TIMEOUT))
+    return json_codec.loads(suitecrm_response.content)
+
+
+def password_grant(username, password, client_id, scope):
+    """
+    Exchange the user's SuiteCRM credentials for an access token (OAuth2 password grant).
+
+    :param username: SuiteCRM user name
+    :param password: SuiteCRM password
+    :param client_id: OAuth client id sent by Alexa
+    :param scope: requested scope sent by Alexa
+    :return: decoded JSON answer of the token endpoint (access_token, token_type... or error, message)
+    """
+    payload = {
+        "grant_type": "password",
+        "client_id": client_id,
+        "client_secret": config.SUITE_CRM_OAUTH_CLIENT_SECRET,
+        "username": username,
+        "password": password,
+        "scope": scope
+    }
+    return _exchanges.do(exchange_key(username, password, client_id), _post_token_request, payload)
+
+
+def exchange_stats():
+    return _exchanges.stats()
+
+
+metrics.gauges('oauth_token_exchanges', 'OAuth token exchanges sent to SuiteCRM and duplicates coalesced into them.',
+               'stat', exchange_stats)
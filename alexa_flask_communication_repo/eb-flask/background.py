@@ -0,0 +1,93 @@
+import config
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_task_stats = {
+    "submitted": 0,
+    "succeeded": 0,
+    "retried": 0,
+    "failed": 0,
+}
+# Most recent tasks that gave up after their last attempt.
+failed_tasks = deque(maxlen=100)
+
+
+def get_executor():
+    """
+    Return the process wide thread pool running work that must not delay the Alexa response.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=config.BACKGROUND_WORKERS)
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) on the background thread pool.
+
+    :return: concurrent.futures.Future of the call.
+    """
+    return get_executor().submit(fn, *args, **kwargs)
+
+
+def _count(name):
+    with _stats_lock:
+        _task_stats[name] += 1
+
+
+def submit_with_retry(name, fn, args=(), max_attempts=3, backoff=1.0):
+    """
+    Run fn(*args) in the background, retrying it when it raises.
+
+    Retries wait backoff * 2 ** (attempt - 1) seconds on a timer so no pool thread sleeps. A task which
+    still fails after max_attempts is recorded in failed_tasks.
+
+    :param name: short description of the task, kept with failures (don't put credentials in it)
+    :param fn: callable raising an exception on failure
+    :param args: positional arguments of fn
+    :param max_attempts: total number of attempts
+    :param backoff: delay in seconds before the first retry
+    """
+    _count("submitted")
+
+    def attempt(attempt_number):
+        try:
+            fn(*args)
+        except Exception as e:
+            if attempt_number < max_attempts:
+                _count("retried")
+                timer = threading.Timer(backoff * (2 ** (attempt_number - 1)), submit, (attempt, attempt_number + 1))
+                timer.daemon = True
+                timer.start()
+            else:
+                _count("failed")
+                failed_tasks.append({
+                    "name": name,
+                    "attempts": attempt_number,
+                    "error": repr(e),
+                    "failed_at": time.time(),
+                })
+        else:
+            _count("succeeded")
+
+    return submit(attempt, 1)
+
+
+def task_stats():
+    """
+    Snapshot of the background task counters.
+    """
+    with _stats_lock:
+        stats = dict(_task_stats)
+    stats["recent_failures"] = len(failed_tasks)
+    return stats
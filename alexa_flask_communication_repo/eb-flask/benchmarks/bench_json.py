@@ -0,0 +1,117 @@
+"""
+Micro-benchmark of the JSON backends available to json_codec.
+
+Compares the stdlib codec with every faster backend installed on the path the service takes: parsing
+Alexa request envelopes and SuiteCRM list payloads from bytes and serializing Alexa responses to bytes.
+
+Usage: python benchmarks/bench_json.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handler
+import json_codec
+
+
+def alexa_intent_envelope():
+    return {
+        "version": "1.0",
+        "session": {
+            "new": False,
+            "sessionId": "amzn1.echo-api.session.0000000-0000-0000-0000-00000000000",
+            "application": {"applicationId": "amzn1.ask.skill.00000000-0000-0000-0000-000000000000"},
+            "attributes": {},
+            "user": {
+                "userId": "amzn1.ask.account." + "A" * 200,
+                "accessToken": "eyJ0eXAiOiJKV1QiLCJhbGciOiJSUzI1NiJ9." + "x" * 600 + "." + "y" * 340,
+            },
+        },
+        "context": {
+            "System": {
+                "application": {"applicationId": "amzn1.ask.skill.00000000-0000-0000-0000-000000000000"},
+                "user": {"userId": "amzn1.ask.account." + "A" * 200},
+                "device": {"deviceId": "amzn1.ask.device." + "B" * 200, "supportedInterfaces": {}},
+                "apiEndpoint": "https://api.amazonalexa.com",
+            }
+        },
+        "request": {
+            "type": "IntentRequest",
+            "requestId": "amzn1.echo-api.request.00000000-0000-0000-0000-000000000000",
+            "timestamp": "2018-08-01T10:00:00Z",
+            "locale": "en-US",
+            "dialogState": "COMPLETED",
+            "intent": {
+                "name": "SugarCrmPostMeetingIntent",
+                "confirmationStatus": "CONFIRMED",
+                "slots": dict((name, {"name": name, "value": value, "confirmationStatus": "NONE"}) for name, value in (
+                    ("name", "Quarterly review"), ("date", "2018-08-02"), ("time", "10:30"),
+                    ("description", "Review the pipeline with the team"), ("duration", "PT1H30M"))),
+            },
+        },
+    }
+
+
+def suitecrm_meeting_list(rows):
+    return {
+        "meta": {"total-pages": 20},
+        "data": [{
+            "type": "Meetings",
+            "id": "%08d-0000-0000-0000-000000000000" % row,
+            "attributes": {
+                "name": "Meeting number %d" % row,
+                "date_start": "2018-08-%02d 10:00:00" % (row % 28 + 1),
+                "duration_hours": 1,
+                "duration_minutes": 30,
+                "description": "Follow up with the customer about the proposal " * 3,
+                "assigned_user_id": "1",
+                "status": "Planned",
+            },
+            "relationships": {"assigned_user_link": {"links": {"related": "/api/v8/modules/Meetings/%d/relationships/assigned_user_link" % row}}},
+            "links": {"self": "/api/v8/modules/Meetings/%d" % row},
+        } for row in range(rows)],
+        "links": {"first": "/api/v8/modules/Meetings?page[number]=1", "next": "/api/v8/modules/Meetings?page[number]=2"},
+    }
+
+
+def alexa_response():
+    output_text = "The list of meetings is as follows : " + "".join(
+        "Meeting number %d on 2018-08-02 10:00:00." % row for row in range(5))
+    return handler.build_response({}, handler.build_speechlet_response(
+        "SugarCrmGetMeetingIntent", output_text, output_text, False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000, help="calls per measurement")
+    args = parser.parse_args()
+
+    std_loads, std_dumps = json_codec.get_codec('json')
+    envelope_bytes = std_dumps(alexa_intent_envelope())
+    small_list_bytes = std_dumps(suitecrm_meeting_list(5))
+    large_list_bytes = std_dumps(suitecrm_meeting_list(100))
+    response = alexa_response()
+    cases = (
+        ("parse Alexa envelope (%d bytes)" % len(envelope_bytes), 'loads', envelope_bytes, args.number),
+        ("parse SuiteCRM list, 5 rows (%d bytes)" % len(small_list_bytes), 'loads', small_list_bytes, args.number),
+        ("parse SuiteCRM list, 100 rows (%d bytes)" % len(large_list_bytes), 'loads', large_list_bytes, max(args.number // 20, 1)),
+        ("serialize Alexa response", 'dumps', response, args.number),
+    )
+
+    print("active backend: %s" % json_codec.BACKEND)
+    for description, operation, payload, number in cases:
+        print(description)
+        baseline = None
+        for backend in json_codec.available_backends()[::-1]:
+            codec_loads, codec_dumps = json_codec.get_codec(backend)
+            fn = codec_loads if operation == 'loads' else codec_dumps
+            best = min(timeit.repeat(lambda: fn(payload), number=number, repeat=3)) / number
+            baseline = baseline or best
+            print("  %-8s %8.2f us/op  x%.2f" % (backend, best * 1e6, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
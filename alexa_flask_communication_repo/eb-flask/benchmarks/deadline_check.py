@@ -0,0 +1,120 @@
+"""
+Regression check of the request deadline against slow SuiteCRM reads shared with background calls.
+
+A listing request that joins a call already in flight (a background prefetch or refresh, which has no
+deadline) must still answer within its own budget: with the stale cached rows when there are some,
+otherwise with the "still working" text. Runs each scenario against a slow fake SuiteCRM and exits with
+status 1 when a request overruns its budget or answers the wrong thing.
+
+Usage: python benchmarks/deadline_check.py --latency 4 --budget 2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+import envelopes
+import load_test
+from fake_suitecrm import FakeSuiteCrm, FakeSuiteCrmConfig
+
+
+def timed_request(call, budget):
+    """
+    Run call() under a deadline of `budget` seconds. :return: tuple of (result, seconds taken)
+    """
+    import deadline
+    token = deadline.set_deadline(time.monotonic() + budget)
+    started = time.perf_counter()
+    try:
+        return call(), time.perf_counter() - started
+    finally:
+        deadline.reset_deadline(token)
+
+
+def start_background_read(handler, query, access_token):
+    """
+    Start a read of query outside of any request, as a prefetch or a stale refresh does, and let it reach SuiteCRM.
+    """
+    import background
+    background.submit(handler.call_suitecrm_api, query, 'GET', access_token)
+    time.sleep(0.2)
+
+
+def check_uncached(handler, budget):
+    config.SUITE_CRM_CACHE_TTL.pop("Leads", None)
+    access_token = envelopes.make_access_token(sub="uncached")
+    start_background_read(handler, handler.leads_query(1), access_token)
+    return timed_request(lambda: handler.call_suitecrm_api(handler.leads_query(1), 'GET', access_token), budget), \
+        handler.SUITE_CRM_PENDING_TEXT
+
+
+def check_stale(handler, budget):
+    config.SUITE_CRM_CACHE_TTL["Leads"] = 60
+    access_token = envelopes.make_access_token(sub="stale")
+    query = handler.leads_query(1)
+    url, column_list, module_name = handler.listing_request(query, [], False)
+    cache_key, cache_ttl, cache_tag = handler.list_cache_entry(url, access_token, column_list, module_name)
+    stale_rows = handler.SuiteCrmRows([("Stale lead",)])
+    handler.suitecrm_list_cache.set(cache_key, stale_rows, 0.01, tags=[cache_tag])
+    time.sleep(0.05)
+    start_background_read(handler, query, access_token)
+    return timed_request(lambda: handler.call_suitecrm_api(query, 'GET', access_token), budget), stale_rows
+
+
+def check_async(handler, budget):
+    import async_handler
+    config.SUITE_CRM_CACHE_TTL.pop("Leads", None)
+    access_token = envelopes.make_access_token(sub="async")
+
+    async def requests():
+        # The first read runs without deadline, the second joins it with one.
+        first = asyncio.ensure_future(async_handler.call_suitecrm_api(handler.leads_query(1), 'GET', access_token))
+        await asyncio.sleep(0.2)
+        second = await timed_async_request(budget, lambda: async_handler.call_suitecrm_api(
+            handler.leads_query(1), 'GET', access_token))
+        await first
+        await async_handler.close_session()
+        return second
+
+    return asyncio.run(requests()), handler.SUITE_CRM_PENDING_TEXT
+
+
+async def timed_async_request(budget, call):
+    import deadline
+    token = deadline.set_deadline(time.monotonic() + budget)
+    started = time.perf_counter()
+    try:
+        return await call(), time.perf_counter() - started
+    finally:
+        deadline.reset_deadline(token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=4.0, help="fake SuiteCRM latency in seconds")
+    parser.add_argument("--budget", type=float, default=2.0, help="time budget of the request in seconds")
+    parser.add_argument("--slack", type=float, default=0.3, help="seconds a request may take past its budget")
+    args = parser.parse_args()
+
+    server = FakeSuiteCrm(FakeSuiteCrmConfig(args.latency, 0.0, 0.0, 50)).start()
+    load_test.point_config_at(server.base_url)
+    config.SUITE_CRM_PREFETCH_NEXT_PAGE = False
+    import handler
+
+    failures = 0
+    for name, check in (("uncached", check_uncached), ("stale", check_stale), ("async", check_async)):
+        (result, seconds), expected = check(handler, args.budget)
+        ok = seconds <= args.budget + args.slack and result == expected
+        failures += not ok
+        print("%-10s %-4s %.2fs %r" % (name, "ok" if ok else "FAIL", seconds, result))
+    server.stop()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
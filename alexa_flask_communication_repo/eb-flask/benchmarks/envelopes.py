@@ -0,0 +1,132 @@
+"""
+Generator of realistic Alexa request envelopes for the load test.
+"""
+import base64
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+APPLICATION_ID = "amzn1.ask.skill.00000000-0000-0000-0000-000000000000"
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def make_access_token(sub="1", expires_in=3600):
+    """
+    SuiteCRM-like JWT access token. The signature is fake: the skill decodes tokens without verifying them.
+    """
+    now = int(time.time())
+    header = {"typ": "JWT", "alg": "RS256", "jti": uuid.uuid4().hex}
+    payload = {"aud": "alexa", "jti": uuid.uuid4().hex, "iat": now, "nbf": now, "exp": now + expires_in,
+               "sub": str(sub), "scopes": []}
+    return _b64(header) + "." + _b64(payload) + "." + "s" * 342
+
+
+def _timestamp():
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _envelope(request, session_id, access_token, new_session, attributes=None):
+    user_id = "amzn1.ask.account." + "A" * 200
+    return {
+        "version": "1.0",
+        "session": {
+            "new": new_session,
+            "sessionId": session_id,
+            "application": {"applicationId": APPLICATION_ID},
+            "attributes": attributes or {},
+            "user": {"userId": user_id, "accessToken": access_token},
+        },
+        "context": {
+            "System": {
+                "application": {"applicationId": APPLICATION_ID},
+                "user": {"userId": user_id, "accessToken": access_token},
+                "device": {"deviceId": "amzn1.ask.device." + "B" * 200, "supportedInterfaces": {}},
+                "apiEndpoint": "https://api.amazonalexa.com",
+            }
+        },
+        "request": request,
+    }
+
+
+def _request(request_type, **fields):
+    request = {
+        "type": request_type,
+        "requestId": "amzn1.echo-api.request." + str(uuid.uuid4()),
+        "timestamp": _timestamp(),
+        "locale": "en-US",
+    }
+    request.update(fields)
+    return request
+
+
+def _slots(values):
+    return dict((name, {"name": name, "value": value, "confirmationStatus": "NONE"}) for name, value in values.items())
+
+
+def launch_request(session_id, access_token):
+    return _envelope(_request("LaunchRequest"), session_id, access_token, True)
+
+
+def intent_request(session_id, access_token, intent_name, slots=None, dialog_state=None,
+                   confirmation_status="NONE", new_session=False, attributes=None):
+    fields = {"intent": {"name": intent_name, "confirmationStatus": confirmation_status, "slots": _slots(slots or {})}}
+    if dialog_state:
+        fields["dialogState"] = dialog_state
+    return _envelope(_request("IntentRequest", **fields), session_id, access_token, new_session, attributes)
+
+
+def session_ended_request(session_id, access_token, reason="USER_INITIATED"):
+    return _envelope(_request("SessionEndedRequest", reason=reason), session_id, access_token, False)
+
+
+def lead_dialog(session_id, access_token):
+    """
+    Turns of a SugarCrmPostLeadIntent dialog: slot elicitation, then the confirmed request.
+    """
+    slots = {"first_name": "Jane", "last_name": "Doe", "description": "Met at the trade show"}
+    yield intent_request(session_id, access_token, "SugarCrmPostLeadIntent", {}, "STARTED")
+    yield intent_request(session_id, access_token, "SugarCrmPostLeadIntent", {"first_name": "Jane"}, "IN_PROGRESS")
+    yield intent_request(session_id, access_token, "SugarCrmPostLeadIntent", slots, "COMPLETED", "CONFIRMED")
+
+
+def meeting_dialog(session_id, access_token):
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).strftime("%Y-%m-%d")
+    slots = {"name": "Pipeline review", "date": tomorrow, "time": "10:30",
+             "description": "Review the pipeline", "duration": "PT1H30M"}
+    yield intent_request(session_id, access_token, "SugarCrmPostMeetingIntent", {}, "STARTED")
+    yield intent_request(session_id, access_token, "SugarCrmPostMeetingIntent", slots, "COMPLETED", "CONFIRMED")
+
+
+def session_turns(user_count=50, rng=random):
+    """
+    Envelopes of one simulated skill session: launch, a few intents and the session end.
+
+    :param user_count: number of distinct SuiteCRM users to pick the session's user from
+    :return: iterator of (label, envelope) tuples, labels being intent names or request types
+    """
+    session_id = "amzn1.echo-api.session." + str(uuid.uuid4())
+    access_token = make_access_token(sub=rng.randint(1, user_count))
+    yield "LaunchRequest", launch_request(session_id, access_token)
+    for _ in range(rng.randint(1, 4)):
+        choice = rng.random()
+        if choice < 0.35:
+            yield "SugarCrmLeadRequestIntent", intent_request(session_id, access_token, "SugarCrmLeadRequestIntent")
+        elif choice < 0.65:
+            date = (datetime.utcnow() + timedelta(days=rng.randint(0, 3))).strftime("%Y-%m-%d")
+            slots = {"datevalue": date} if rng.random() < 0.5 else {}
+            yield "SugarCrmGetMeetingIntent", intent_request(session_id, access_token, "SugarCrmGetMeetingIntent", slots)
+        elif choice < 0.75:
+            for envelope in lead_dialog(session_id, access_token):
+                yield "SugarCrmPostLeadIntent", envelope
+        elif choice < 0.85:
+            for envelope in meeting_dialog(session_id, access_token):
+                yield "SugarCrmPostMeetingIntent", envelope
+        else:
+            yield "AMAZON.HelpIntent", intent_request(session_id, access_token, "AMAZON.HelpIntent")
+    yield "SessionEndedRequest", session_ended_request(session_id, access_token)
@@ -0,0 +1,253 @@
+"""
+Local stand-in for the SuiteCRM endpoints used by the skill.
+
+Implements /api/v8/modules/<Module> listings (JSON:API paging with page[size]/page[number]), record creation,
+the assigned-user relationship PATCH, /api/oauth/access_token and the login/set_entries methods of the
+v4_1 REST API, with configurable latency, error rate and payload size.
+
+Usage: python benchmarks/fake_suitecrm.py --port 8081 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+
+MODULE_PATH = re.compile(r'^/api/v8/modules/(\w+)/?$')
+RELATIONSHIP_PATH = re.compile(r'^/api/v8/modules/(\w+)/([\w-]+)/relationships/assigned_user_link/?$')
+
+
+class FakeSuiteCrmConfig(object):
+    """
+    Behaviour of the fake server.
+
+    :param latency: mean added latency in seconds of every response
+    :param jitter: latency is drawn uniformly in latency +/- jitter
+    :param error_rate: probability of answering with a 500 error
+    :param total_records: number of records of every module listing
+    :param description_size: length of the description attribute of every record
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, total_records=50, description_size=100):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.total_records = total_records
+        self.description_size = description_size
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeSuiteCrmHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def _base_url(self):
+        return 'http://%s:%d' % self.server.server_address[:2]
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/vnd.api+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body.decode('utf-8')) if body else {}
+
+    def _read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        return dict((name, values[0]) for name, values in parse_qs(body).items())
+
+    def _rest_call(self):
+        form = self._read_form()
+        rest_data = json.loads(form.get('rest_data') or '{}')
+        method = form.get('method')
+        if method == 'login':
+            return self._send_json(200, {"id": "fake-session-" + uuid.uuid4().hex, "module_name": "Users"})
+        if method == 'set_entries':
+            name_value_lists = rest_data.get('name_value_lists') or []
+            with self.server.stats_lock:
+                first = self.server.stats['created'] + 1
+                self.server.stats['created'] += len(name_value_lists)
+                self.server.stats['batches'] += 1
+            return self._send_json(200, {"ids": ["%08d-0000-4000-8000-000000000000" % number
+                                                 for number in range(first, first + len(name_value_lists))]})
+        self._send_json(200, {"name": "Invalid Method", "number": 20, "description": "Unknown method"})
+
+    def _simulate(self):
+        """
+        Sleep the configured latency and decide whether this request fails.
+        """
+        with self.server.stats_lock:
+            self.server.stats['requests'] += 1
+        delay = self.settings.latency
+        if self.settings.jitter:
+            delay += random.uniform(-self.settings.jitter, self.settings.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.settings.error_rate and random.random() < self.settings.error_rate:
+            with self.server.stats_lock:
+                self.server.stats['errors'] += 1
+            self._send_json(500, {"error": "server_error", "message": "Simulated failure"})
+            return False
+        return True
+
+    def _record(self, module_name, number):
+        return {
+            "type": module_name,
+            "id": "%08d-0000-4000-8000-000000000000" % number,
+            "attributes": {
+                "name": "%s %d" % (module_name[:-1], number),
+                "first_name": "First%d" % number,
+                "last_name": "Last%d" % number,
+                "date_start": "2018-08-%02d %02d:00:00" % (number % 28 + 1, 8 + number % 10),
+                "date_due": "2018-08-%02d" % (number % 28 + 1),
+                "status": "Planned",
+                "assigned_user_id": "1",
+                "description": ("x" * self.settings.description_size),
+            },
+            "relationships": {
+                "assigned_user_link": {"links": {"related": "%s/api/v8/modules/%s/%08d-0000-4000-8000-000000000000/relationships/assigned_user_link"
+                                                            % (self._base_url(), module_name, number)}}
+            },
+        }
+
+    def do_GET(self):
+        if not self._simulate():
+            return
+        parts = urlsplit(self.path)
+        match = MODULE_PATH.match(parts.path)
+        if not match:
+            return self._send_json(404, {"error": "not_found", "message": "Unknown path " + parts.path})
+        module_name = match.group(1)
+        query = parse_qs(parts.query)
+        page_size = int((query.get('page[size]') or ['20'])[0])
+        page_number = int((query.get('page[number]') or ['1'])[0])
+        fields = (query.get('fields[%s]' % module_name) or [''])[0]
+        first = (page_number - 1) * page_size
+        last = min(first + page_size, self.settings.total_records)
+        records = [self._record(module_name, number) for number in range(first + 1, last + 1)]
+        if fields:
+            wanted = fields.split(',')
+            for record in records:
+                record["attributes"] = dict((name, record["attributes"].get(name)) for name in wanted)
+        total_pages = max((self.settings.total_records + page_size - 1) // page_size, 1)
+        links = {}
+        if page_number < total_pages:
+            links["next"] = "%s/api/v8/modules/%s?page[size]=%d&page[number]=%d" % (
+                self._base_url(), module_name, page_size, page_number + 1)
+        self._send_json(200, {"meta": {"total-pages": total_pages}, "data": records, "links": links})
+
+    def do_POST(self):
+        if not self._simulate():
+            return
+        path = urlsplit(self.path).path
+        if path == '/service/v4_1/rest.php':
+            return self._rest_call()
+        body = self._read_json()
+        if path == '/api/oauth/access_token':
+            return self._send_json(200, {
+                "token_type": "Bearer",
+                "expires_in": 3600,
+                "access_token": "fake-" + uuid.uuid4().hex,
+                "refresh_token": "fake-refresh-" + uuid.uuid4().hex,
+            })
+        match = MODULE_PATH.match(path)
+        if not match:
+            return self._send_json(404, {"error": "not_found", "message": "Unknown path " + path})
+        with self.server.stats_lock:
+            self.server.stats['created'] += 1
+            number = self.server.stats['created']
+        record = self._record(match.group(1), number)
+        record["attributes"].update((body.get("data") or {}).get("attributes") or {})
+        self._send_json(201, {"data": record})
+
+    def do_PATCH(self):
+        if not self._simulate():
+            return
+        path = urlsplit(self.path).path
+        if not RELATIONSHIP_PATH.match(path):
+            return self._send_json(404, {"error": "not_found", "message": "Unknown path " + path})
+        body = self._read_json()
+        with self.server.stats_lock:
+            self.server.stats['assigned'] += 1
+        self._send_json(200, {"meta": {"message": "Relationship updated"}, "data": body.get("data")})
+
+
+class FakeSuiteCrm(object):
+    """
+    Fake SuiteCRM server running in a background thread, e.g.
+
+        server = FakeSuiteCrm(FakeSuiteCrmConfig(latency=0.05)).start()
+        load_test.point_config_at(server.base_url)
+        ...
+        server.stop()
+    """
+
+    def __init__(self, settings=None, host='127.0.0.1', port=0):
+        self.httpd = _ThreadingHTTPServer((host, port), FakeSuiteCrmHandler)
+        self.httpd.settings = settings or FakeSuiteCrmConfig()
+        self.httpd.stats_lock = threading.Lock()
+        self.httpd.stats = {"requests": 0, "errors": 0, "created": 0, "assigned": 0, "batches": 0}
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return 'http://%s:%d' % self.httpd.server_address[:2]
+
+    @property
+    def stats(self):
+        with self.httpd.stats_lock:
+            return dict(self.httpd.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-suitecrm')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean added latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 500 answer")
+    parser.add_argument("--records", type=int, default=50, help="records per module listing")
+    parser.add_argument("--description-size", type=int, default=100, help="length of record descriptions")
+    args = parser.parse_args()
+    settings = FakeSuiteCrmConfig(args.latency, args.jitter, args.error_rate, args.records, args.description_size)
+    server = FakeSuiteCrm(settings, args.host, args.port)
+    print("Fake SuiteCRM listening on " + server.base_url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Load test of the Alexa endpoint against the fake SuiteCRM server.
+
+Replays simulated skill sessions (see envelopes.py) against application.index through the WSGI test
+client, asgi.application, or a running server, and reports throughput and p50/p95/p99 latency per intent.
+Save a run with --output and compare later runs against it with --baseline.
+
+Usage: python benchmarks/load_test.py --sessions 200 --concurrency 16 --latency 0.05 --output baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import config
+import envelopes
+from fake_suitecrm import FakeSuiteCrm, FakeSuiteCrmConfig
+
+
+FAILED_RESPONSE = b'"Sorry for interruption. You can call other APIs "'
+
+
+def point_config_at(base_url):
+    config.SUITE_CRM_INSTANCE_IP_URL = base_url
+    config.SUITE_CRM_INSTANCE_BASE_URL = base_url
+    config.SUITE_CRM_INSTANCE_REST_URL = base_url + "/service/v4_1/rest.php"
+    config.SUITE_CRM_INSTANCE_OAUTH_URL = base_url + "/api/oauth/access_token"
+    config.SUITE_CRM_INSTANCE_MODULES_URL = base_url + "/api/v8/modules/"
+
+
+class Recorder(object):
+    """
+    Latency samples and error counts per label.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, label, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    index = min(int(round(q * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+
+def summarize(recorder, wall_seconds):
+    report = {"wall_seconds": wall_seconds, "intents": {}}
+    all_samples = []
+    for label, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        all_samples.extend(ordered)
+        report["intents"][label] = {
+            "count": len(ordered),
+            "errors": recorder.errors.get(label, 0),
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1],
+        }
+    all_samples.sort()
+    report["total"] = {
+        "count": len(all_samples),
+        "errors": sum(recorder.errors.values()),
+        "throughput": len(all_samples) / wall_seconds if wall_seconds else 0.0,
+        "p50": percentile(all_samples, 0.50),
+        "p95": percentile(all_samples, 0.95),
+        "p99": percentile(all_samples, 0.99),
+    }
+    return report
+
+
+def print_report(report, baseline=None):
+    def delta(label, key):
+        """Relative change against the baseline of the whole run (label None) or of one intent."""
+        if not baseline:
+            return ""
+        previous = baseline.get("total", {}) if label is None else baseline.get("intents", {}).get(label, {})
+        current = report["total"] if label is None else report["intents"][label]
+        if not previous.get(key):
+            return ""
+        return " (%+.0f%%)" % ((current[key] - previous[key]) * 100.0 / previous[key])
+
+    total = report["total"]
+    print("%d requests in %.2fs, %.1f req/s%s, %d errors" % (
+        total["count"], report["wall_seconds"], total["throughput"], delta(None, "throughput"), total["errors"]))
+    print("%-28s %7s %7s %14s %14s %14s" % ("intent", "count", "errors", "p50 ms", "p95 ms", "p99 ms"))
+    for label, stats in report["intents"].items():
+        print("%-28s %7d %7d %14s %14s %14s" % (
+            label, stats["count"], stats["errors"],
+            "%.1f%s" % (stats["p50"] * 1000, delta(label, "p50")),
+            "%.1f%s" % (stats["p95"] * 1000, delta(label, "p95")),
+            "%.1f%s" % (stats["p99"] * 1000, delta(label, "p99"))))
+    print("%-28s %7d %7d %14.1f %14.1f %14.1f" % (
+        "all", total["count"], total["errors"], total["p50"] * 1000, total["p95"] * 1000, total["p99"] * 1000))
+
+
+def build_sessions(count, users, seed):
+    rng = random.Random(seed)
+    return [list(envelopes.session_turns(users, rng)) for _ in range(count)]
+
+
+def run_wsgi(sessions, concurrency, recorder):
+    import application
+    local = threading.local()
+
+    def run_session(turns):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = application.application.test_client()
+        for label, envelope in turns:
+            body = json.dumps(envelope)
+            started = time.perf_counter()
+            response = client.post('/', data=body, content_type='application/json')
+            data = response.get_data()
+            recorder.record(label, time.perf_counter() - started, response.status_code == 200 and data != FAILED_RESPONSE)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run_session, sessions))
+
+
+def run_asgi(sessions, concurrency, recorder):
+    import asgi
+    import async_handler
+
+    async def post(body):
+        sent = []
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi.application({'type': 'http', 'path': '/', 'method': 'POST', 'headers': []}, receive, send)
+        return sent[0]['status'], sent[1]['body']
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_session(turns):
+            async with semaphore:
+                for label, envelope in turns:
+                    body = json.dumps(envelope).encode('utf-8')
+                    started = time.perf_counter()
+                    status, data = await post(body)
+                    recorder.record(label, time.perf_counter() - started, status == 200 and data != FAILED_RESPONSE)
+
+        await asyncio.gather(*[run_session(turns) for turns in sessions])
+        await async_handler.close_session()
+
+    asyncio.run(main())
+
+
+def run_url(sessions, concurrency, recorder, url):
+    import requests
+    local = threading.local()
+
+    def run_session(turns):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        for label, envelope in turns:
+            started = time.perf_counter()
+            response = session.post(url, data=json.dumps(envelope), headers={'Content-Type': 'application/json'})
+            recorder.record(label, time.perf_counter() - started,
+                            response.status_code == 200 and response.content != FAILED_RESPONSE)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run_session, sessions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=("wsgi", "asgi", "url"), default="wsgi")
+    parser.add_argument("--url", help="endpoint of a running server, with --target url")
+    parser.add_argument("--sessions", type=int, default=200, help="simulated skill sessions")
+    parser.add_argument("--concurrency", type=int, default=16, help="sessions in flight at once")
+    parser.add_argument("--users", type=int, default=50, help="distinct SuiteCRM users")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the session generator")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake SuiteCRM mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="fake SuiteCRM latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake SuiteCRM error probability")
+    parser.add_argument("--records", type=int, default=50, help="records per fake SuiteCRM listing")
+    parser.add_argument("--batch-writes", action="store_true", help="create records through the write batcher")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare with")
+    args = parser.parse_args()
+
+    server = None
+    if args.target != "url":
+        server = FakeSuiteCrm(FakeSuiteCrmConfig(args.latency, args.jitter, args.error_rate, args.records)).start()
+        point_config_at(server.base_url)
+    elif not args.url:
+        parser.error("--target url needs --url")
+
+    config.SUITE_CRM_WRITE_BATCHING = args.batch_writes
+    sessions = build_sessions(args.sessions, args.users, args.seed)
+    recorder = Recorder()
+    started = time.perf_counter()
+    if args.target == "wsgi":
+        run_wsgi(sessions, args.concurrency, recorder)
+    elif args.target == "asgi":
+        run_asgi(sessions, args.concurrency, recorder)
+    else:
+        run_url(sessions, args.concurrency, recorder, args.url)
+    report = summarize(recorder, time.perf_counter() - started)
+    report["settings"] = vars(args)
+    if server is not None:
+        report["suitecrm"] = server.stats
+        server.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+    if server is not None:
+        print("fake SuiteCRM: %(requests)d requests, %(errors)d errors, %(created)d created in %(batches)d batches, "
+              "%(assigned)d assigned"
+              % report["suitecrm"])
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Cold start report of the Alexa endpoint.
+
+Starts a fresh interpreter per run, imports application against the fake SuiteCRM server and reports the
+import time (with the slowest modules from python -X importtime), the warm-up time and the latency of the
+first and second request of a few kinds. Save a run with --output and compare later runs against it with
+--baseline.
+
+Usage: python benchmarks/startup_report.py --runs 5 --warm-up-mode blocking --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import envelopes
+
+
+def sample_requests(sub):
+    """
+    (label, envelope) of the requests timed in a run: a static answer, a listing and a record creation.
+    """
+    session_id = "amzn1.echo-api.session." + str(uuid.uuid4())
+    access_token = envelopes.make_access_token(sub=sub)
+    meeting = list(envelopes.meeting_dialog(session_id, access_token))[-1]
+    return [
+        ("LaunchRequest", envelopes.launch_request(session_id, access_token)),
+        ("SugarCrmLeadRequestIntent",
+         envelopes.intent_request(session_id, access_token, "SugarCrmLeadRequestIntent")),
+        ("SugarCrmPostMeetingIntent", meeting),
+    ]
+
+
+def run_child(warm_up_mode, latency):
+    """
+    Body of one run, in the fresh interpreter: prints the measurements as JSON.
+    """
+    from fake_suitecrm import FakeSuiteCrm, FakeSuiteCrmConfig
+    import config
+    import load_test
+
+    server = FakeSuiteCrm(FakeSuiteCrmConfig(latency, 0.0, 0.0, 50)).start()
+    load_test.point_config_at(server.base_url)
+    config.WARM_UP_MODE = warm_up_mode
+    # Keep background prefetches of the next page from overlapping the requests being timed.
+    config.SUITE_CRM_PREFETCH_NEXT_PAGE = False
+
+    started = time.perf_counter()
+    import application
+    import_seconds = time.perf_counter() - started
+    import warmup
+
+    client = application.application.test_client()
+    report = {"import_seconds": import_seconds, "warm_up": warmup.report(), "requests": {}}
+    # The second request of a kind is made for another user, so it isn't answered from the first one's cache.
+    for round_name, sub in (("first", 1), ("second", 2)):
+        for label, envelope in sample_requests(sub):
+            body = json.dumps(envelope)
+            started = time.perf_counter()
+            client.post('/', data=body, content_type='application/json').get_data()
+            report["requests"].setdefault(label, {})[round_name] = time.perf_counter() - started
+    server.stop()
+    print(json.dumps(report))
+
+
+def parse_importtime(stderr, top):
+    """
+    Slowest modules of a python -X importtime trace, by self time.
+
+    :return: list of [module, self seconds, cumulative seconds]
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append([name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6])
+    modules.sort(key=lambda module: module[1], reverse=True)
+    return modules[:top]
+
+
+def run_once(warm_up_mode, latency, top):
+    completed = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__), "--child",
+                                "--warm-up-mode", warm_up_mode, "--latency", str(latency)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report["slowest_imports"] = parse_importtime(completed.stderr, top)
+    return report
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+
+def summarize(runs):
+    """
+    Median of every measurement over the runs; the slowest imports are those of the first run.
+    """
+    report = {
+        "runs": len(runs),
+        "import_seconds": median([run["import_seconds"] for run in runs]),
+        "warm_up_seconds": median([run["warm_up"].get("seconds", 0.0) for run in runs]),
+        "requests": {},
+        "slowest_imports": runs[0]["slowest_imports"],
+    }
+    for label in runs[0]["requests"]:
+        report["requests"][label] = dict(
+            (round_name, median([run["requests"][label][round_name] for run in runs])) for round_name in ("first", "second"))
+    return report
+
+
+def print_report(report, baseline=None):
+    def delta(current, previous):
+        if not previous:
+            return ""
+        return " (%+.0f%%)" % ((current - previous) * 100.0 / previous)
+
+    baseline = baseline or {}
+    print("median of %d cold starts" % report["runs"])
+    print("import application %.1f ms%s, warm-up %.1f ms%s" % (
+        report["import_seconds"] * 1000, delta(report["import_seconds"], baseline.get("import_seconds")),
+        report["warm_up_seconds"] * 1000, delta(report["warm_up_seconds"], baseline.get("warm_up_seconds"))))
+    print("%-28s %16s %16s" % ("request", "first ms", "second ms"))
+    for label, stats in report["requests"].items():
+        previous = baseline.get("requests", {}).get(label, {})
+        print("%-28s %16s %16s" % (
+            label,
+            "%.1f%s" % (stats["first"] * 1000, delta(stats["first"], previous.get("first"))),
+            "%.1f%s" % (stats["second"] * 1000, delta(stats["second"], previous.get("second")))))
+    print("slowest imports (self ms / cumulative ms):")
+    for name, self_seconds, cumulative_seconds in report["slowest_imports"]:
+        print("  %-40s %8.1f %8.1f" % (name, self_seconds * 1000, cumulative_seconds * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to take the median of")
+    parser.add_argument("--warm-up-mode", choices=("blocking", "background", "off"), default="blocking")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake SuiteCRM mean latency in seconds")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare with")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args.warm_up_mode, args.latency)
+
+    report = summarize([run_once(args.warm_up_mode, args.latency, args.top) for _ in range(args.runs)])
+    report["settings"] = vars(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
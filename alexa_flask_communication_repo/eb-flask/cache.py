@@ -0,0 +1,179 @@
+import singleflight
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """
+    Rough estimate, in bytes, of the memory held by a cached value.
+
+    Only walks the containers SuiteCRM results are made of (lists, tuples, dicts), which is enough to keep
+    the cache under its memory cap without the cost of a full object graph walk.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            size += estimate_size(item)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key) + estimate_size(item)
+    return size
+
+
+class TTLLRUCache(object):
+    """
+    Thread-safe in-process cache with a time-to-live per entry and LRU eviction.
+
+    Entries are evicted least recently used first once either max_entries or max_bytes is exceeded.
+    Each entry can carry tags so a group of entries (e.g. every Leads listing of one user) can be
+    invalidated at once. Expired entries are kept for stale_grace more seconds, during which get_stale()
+    still returns them.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=8 * 1024 * 1024, stale_grace=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_grace = stale_grace
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, size, tags)
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_hits = 0
+        self._fills = singleflight.SingleFlight()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default when it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            now = time.monotonic()
+            if entry[1] <= now:
+                if entry[1] + self.stale_grace <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_stale(self, key, default=None):
+        """
+        Return the value cached for key even if it expired less than stale_grace seconds ago, or default.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] + self.stale_grace <= time.monotonic():
+                return default
+            self.stale_hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl, tags=()):
+        """
+        Store value under key for ttl seconds.
+
+        :param key: hashable cache key
+        :param value: value to cache
+        :param ttl: time to live in seconds
+        :param tags: iterable of tags used by invalidate_tag
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        tags = tuple(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size, tags)
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def get_or_fill(self, key, fill, timeout=None):
+        """
+        Return the cached value for key, or the result of fill() which is expected to store it.
+
+        Concurrent callers missing the same key share a single fill() call.
+
+        :param timeout: seconds to wait for a fill started by another caller, unlimited when None
+        :raises: concurrent.futures.TimeoutError when that fill doesn't end within timeout.
+        """
+        value = self.get(key)
+        if value is None:
+            value = self._fills.do(key, fill, timeout=timeout)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_tag(self, tag):
+        """
+        Drop every entry stored with the given tag.
+
+        :return: number of entries removed
+        """
+        with self._lock:
+            keys = self._tags.pop(tag, ())
+            for key in list(keys):
+                if key in self._entries:
+                    self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        value, expires_at, size, tags = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            tagged_keys = self._tags.get(tag)
+            if tagged_keys is not None:
+                tagged_keys.discard(key)
+                if not tagged_keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        """
+        Snapshot of the cache counters.
+
+        :return: Dictionary with hits, misses, hit_ratio, evictions, stale_hits, coalesced_fills, entries and bytes.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (float(self.hits) / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_hits": self.stale_hits,
+                "coalesced_fills": self._fills.coalesced,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
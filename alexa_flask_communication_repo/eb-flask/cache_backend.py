@@ -0,0 +1,442 @@
+"""
+Cache storage shared between worker processes and nodes.
+
+make_cache() returns the cache used for one kind of data (SuiteCRM listings, decoded tokens...). With the
+"memory" backend it is a per-process cache.TTLLRUCache; with a shared backend it is a SharedCache offering
+the same interface on top of one of the key/value backends below:
+
+    MemoryBackend  - in-process dictionary, a stand-in for the shared backends in development and tests
+    SqliteBackend  - SQLite file shared by the worker processes of one node
+    RedisBackend   - Redis server shared by every node (needs the optional redis package)
+
+Keys are namespaced by a hash of config.SUITE_CRM_INSTANCE_BASE_URL, so several skills pointing at different
+SuiteCRM instances can share one store. Entries are stored as JSON (see json_codec), so a value that isn't
+made of JSON types (e.g. a tuple or namedtuple that must come back as such) needs the encode/decode functions
+of make_cache().
+"""
+import cache
+import config
+import hashlib
+import json_codec
+import os
+import singleflight
+import sqlite3
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class CacheBackend(object):
+    """
+    Key/value store of bytes with expiry, the storage interface used by SharedCache.
+    """
+
+    def get_many(self, keys):
+        """
+        :return: list of the values stored under keys, None for missing or expired ones.
+        """
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """
+        Store value under key, for ttl seconds or without expiry when ttl is None.
+        """
+        raise NotImplementedError
+
+    def add(self, key, value, ttl):
+        """
+        Store value under key only if no live value is stored there.
+
+        :return: True when the value was stored.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key):
+        """
+        Increment the integer stored under key (0 when missing), without expiry.
+
+        :return: the new value
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Backend keeping everything in a dictionary of the current process.
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            entries = [self._live(key, now) for key in keys]
+        return [entry[0] if entry is not None else None for entry in entries]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl is not None else None)
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._values[key] = (value, now + ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            entry = self._live(key, time.time())
+            value = int(entry[0]) + 1 if entry is not None else 1
+            self._values[key] = (str(value).encode('ascii'), None)
+            return value
+
+
+class SqliteBackend(CacheBackend):
+    """
+    Backend storing entries in a SQLite database file, shared by every process of the node opening it.
+
+    :param path: path of the database file
+    :param purge_interval: number of writes between two deletions of expired rows
+    """
+
+    def __init__(self, path, purge_interval=1000):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._writes = 0
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS cache_entries "
+                           "(key TEXT PRIMARY KEY, value BLOB, expires_at REAL) WITHOUT ROWID")
+
+    def _connection(self):
+        # One connection per thread, opened again in worker processes forked after the first one was made.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get_many(self, keys):
+        now = time.time()
+        rows = self._connection().execute(
+            "SELECT key, value FROM cache_entries WHERE key IN ({0}) AND (expires_at IS NULL OR expires_at > ?)"
+            .format(','.join('?' * len(keys))), list(keys) + [now]).fetchall()
+        values = dict(rows)
+        return [values.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        self._connection().execute("INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                                   (key, value, time.time() + ttl if ttl is not None else None))
+        self._count_write()
+
+    def add(self, key, value, ttl):
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = connection.execute("INSERT OR IGNORE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                                        (key, value, now + ttl))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def incr(self, key):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT value FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            value = int(row[0]) + 1 if row is not None else 1
+            connection.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, NULL)",
+                               (key, str(value).encode('ascii')))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return value
+
+    def _count_write(self):
+        self._writes += 1
+        if self._writes % self.purge_interval == 0:
+            self._connection().execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+
+
+class RedisBackend(CacheBackend):
+    """
+    Backend storing entries in a Redis server (or anything speaking its protocol).
+
+    :param url: server URL, e.g. redis://localhost:6379/0
+    """
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("The redis cache backend needs the redis package")
+        self.client = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        return self.client.mget(keys)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl is not None else None)
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, value, px=int(ttl * 1000), nx=True))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+# Tag invalidating every entry of a SharedCache, see SharedCache.clear().
+ALL_ENTRIES_TAG = '*'
+
+
+class SharedCache(object):
+    """
+    Cache with the interface of cache.TTLLRUCache storing JSON entries in a CacheBackend.
+
+    Tags are invalidated by generation: an entry records the generation of each of its tags when it is
+    stored, and invalidate_tag() increments the tag's generation, which makes every entry stored before
+    outdated without having to find them. Expired entries are kept stale_grace more seconds for get_stale().
+
+    :param backend: CacheBackend storing the entries
+    :param namespace: prefix of every key, see namespace()
+    :param stale_grace: seconds an expired entry can still be read with get_stale()
+    :param encode: function turning a value into JSON types, None when values already are
+    :param decode: function rebuilding a value from what encode returned
+    """
+
+    def __init__(self, backend, namespace, stale_grace=0, encode=None, decode=None):
+        self.backend = backend
+        self.namespace = namespace
+        self.stale_grace = stale_grace
+        self.encode = encode
+        self.decode = decode
+        self._fills = singleflight.SingleFlight()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _key(self, key):
+        return self.namespace + 'entry:' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def _tag_key(self, tag):
+        return self.namespace + 'tag:' + hashlib.sha1(repr(tag).encode('utf-8')).hexdigest()
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _read(self, key):
+        """
+        :return: tuple of (value, expires_at) of a live entry whose tags were not invalidated, or None.
+        """
+        try:
+            data = self.backend.get(self._key(key))
+            if data is None:
+                return None
+            expires_at, tag_generations, value = json_codec.loads(data)
+            if tag_generations:
+                current_generations = self.backend.get_many([tag_key for tag_key, _ in tag_generations])
+                for (tag_key, generation), current_generation in zip(tag_generations, current_generations):
+                    if int(current_generation or 0) != generation:
+                        return None
+            if self.decode is not None:
+                value = self.decode(value)
+            return value, expires_at
+        except Exception:
+            # The cache must never fail a request: an unreachable store is a miss.
+            self._count('errors')
+            return None
+
+    def get(self, key, default=None):
+        entry = self._read(key)
+        if entry is None or entry[1] <= time.time():
+            self._count('misses')
+            return default
+        self._count('hits')
+        return entry[0]
+
+    def get_stale(self, key, default=None):
+        entry = self._read(key)
+        if entry is None:
+            return default
+        self._count('stale_hits')
+        return entry[0]
+
+    def set(self, key, value, ttl, tags=()):
+        tag_keys = [self._tag_key(tag) for tag in tuple(tags) + (ALL_ENTRIES_TAG,)]
+        try:
+            generations = self.backend.get_many(tag_keys)
+            tag_generations = [[tag_key, int(generation or 0)] for tag_key, generation in zip(tag_keys, generations)]
+            if self.encode is not None:
+                value = self.encode(value)
+            data = json_codec.dumps([time.time() + ttl, tag_generations, value])
+            self.backend.set(self._key(key), data, ttl + self.stale_grace)
+        except Exception:
+            self._count('errors')
+
+    def get_or_fill(self, key, fill, lock_ttl=None, wait=None, timeout=None):
+        """
+        Return the cached value for key, or the result of fill() which is expected to store it.
+
+        Only one caller fills a missing entry at a time: callers in this process share its result, and other
+        processes wait up to `wait` seconds for the entry to appear before filling it themselves.
+
+        :param timeout: seconds the caller can wait in all, e.g. the time left before its deadline: bounds
+                        both the wait for a fill of this process and the wait for another process's fill.
+        :raises: concurrent.futures.TimeoutError when a fill of this process doesn't end within timeout.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        wait = config.CACHE_FILL_WAIT if wait is None else wait
+        if timeout is not None:
+            wait = max(min(wait, timeout), 0)
+        return self._fills.do(key, self._fill, key, fill, config.CACHE_FILL_LOCK_TTL if lock_ttl is None else lock_ttl,
+                              wait, timeout=timeout)
+
+    def _fill(self, key, fill, lock_ttl, wait):
+        lock_key = self._key(key) + ':fill'
+        try:
+            locked = self.backend.add(lock_key, b'1', lock_ttl)
+        except Exception:
+            self._count('errors')
+            return fill()
+        if locked:
+            try:
+                return fill()
+            finally:
+                self.delete(lock_key, raw=True)
+        give_up_at = time.monotonic() + wait
+        while time.monotonic() < give_up_at:
+            time.sleep(0.02)
+            entry = self._read(key)
+            if entry is not None and entry[1] > time.time():
+                self._count('hits')
+                return entry[0]
+        return fill()
+
+    def delete(self, key, raw=False):
+        try:
+            self.backend.delete(key if raw else self._key(key))
+        except Exception:
+            self._count('errors')
+
+    def invalidate_tag(self, tag):
+        """
+        Make every entry stored with the given tag outdated.
+        """
+        try:
+            self.backend.incr(self._tag_key(tag))
+        except Exception:
+            self._count('errors')
+            return 0
+        self._count('invalidations')
+        return 1
+
+    def clear(self):
+        self.invalidate_tag(ALL_ENTRIES_TAG)
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (float(self.hits) / lookups) if lookups else 0.0,
+                "stale_hits": self.stale_hits,
+                "invalidations": self.invalidations,
+                "errors": self.errors,
+                "coalesced_fills": self._fills.coalesced,
+            }
+
+
+def namespace(name):
+    """
+    Key prefix of the cache `name` for the configured SuiteCRM instance.
+    """
+    instance = hashlib.sha1(config.SUITE_CRM_INSTANCE_BASE_URL.encode('utf-8')).hexdigest()[:12]
+    return 'alexa-skill:{0}:{1}:'.format(instance, name)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(backend_name):
+    """
+    Return the process wide CacheBackend called backend_name ("sqlite", "redis" or "shared-memory").
+    """
+    with _backends_lock:
+        backend = _backends.get(backend_name)
+        if backend is None:
+            if backend_name == "sqlite":
+                backend = SqliteBackend(config.CACHE_SQLITE_PATH)
+            elif backend_name == "redis":
+                backend = RedisBackend(config.CACHE_REDIS_URL)
+            elif backend_name == "shared-memory":
+                backend = MemoryBackend()
+            else:
+                raise ValueError("Unknown cache backend " + str(backend_name))
+            _backends[backend_name] = backend
+        return backend
+
+
+def make_cache(name, max_entries=1024, max_bytes=8 * 1024 * 1024, stale_grace=0, backend_name=None,
+               encode=None, decode=None):
+    """
+    Create the cache `name` on the configured backend.
+
+    :param max_entries: entry limit of a per-process cache (shared backends manage their own memory)
+    :param max_bytes: memory limit of a per-process cache
+    :param stale_grace: seconds expired entries can still be read with get_stale()
+    :param backend_name: "memory", "sqlite", "redis" or "shared-memory", config.CACHE_BACKEND by default
+    :param encode: function turning a value into JSON types for a shared backend, None when values already are
+    :param decode: function rebuilding a value from what encode returned
+    """
+    backend_name = backend_name or config.CACHE_BACKEND
+    if backend_name == "memory":
+        return cache.TTLLRUCache(max_entries=max_entries, max_bytes=max_bytes, stale_grace=stale_grace)
+    return SharedCache(get_backend(backend_name), namespace(name), stale_grace=stale_grace, encode=encode,
+                       decode=decode)
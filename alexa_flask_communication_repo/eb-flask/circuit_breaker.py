@@ -0,0 +1,115 @@
+"""
+Circuit breakers in front of SuiteCRM endpoints.
+
+After config.SUITE_CRM_BREAKER_FAILURE_THRESHOLD consecutive failures calls to an endpoint are rejected at
+once for config.SUITE_CRM_BREAKER_RESET_TIMEOUT seconds, instead of each of them waiting for its timeout.
+Then a single trial call is let through, closing the circuit again when it succeeds. Should the trial never
+report back, another one is let through after reset_timeout more seconds.
+"""
+import config
+import threading
+import time
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an endpoint whose circuit is open.
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Failure counter of one endpoint.
+
+    :param name: name of the endpoint
+    :param failure_threshold: consecutive failures opening the circuit
+    :param reset_timeout: seconds the circuit stays open before a trial call
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.rejections = 0
+        self._opened_at = 0.0
+        self._trial_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Check whether a call may be sent now. Every allowed call must be followed by record_success()
+        or record_failure().
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if (self.state == OPEN and now - self._opened_at >= self.reset_timeout) or \
+                    (self.state == HALF_OPEN and now - self._trial_at >= self.reset_timeout):
+                self.state = HALF_OPEN
+                self._trial_at = now
+                return True
+            self.rejections += 1
+            return False
+
+    def check(self):
+        """
+        Like allow(), raising CircuitOpenError when the call is rejected.
+        """
+        if not self.allow():
+            raise CircuitOpenError("SuiteCRM endpoint '{0}' is failing, call rejected".format(self.name))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = CLOSED
+
+    def release(self):
+        """
+        End an allowed call that tells nothing about the endpoint, e.g. one cut short by the caller's deadline.
+        A half open circuit lets the next call through as its trial.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_at = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """
+    Return the circuit breaker of an endpoint, creating it on first use.
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name, config.SUITE_CRM_BREAKER_FAILURE_THRESHOLD,
+                                                           config.SUITE_CRM_BREAKER_RESET_TIMEOUT)
+    return breaker
+
+
+def open_circuits():
+    """
+    :return: Dictionary keyed by endpoint name, 1 when its circuit is open or half open, else 0.
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return dict((breaker.name, 0 if breaker.state == CLOSED else 1) for breaker in breakers)
@@ -10,5 +10,143 @@ SUITE_CRM_INSTANCE_IP_URL =  "http://18.111.12.92/suitecrm"
 SUITE_CRM_INSTANCE_BASE_URL = "https://suitcrm.demoexample.in"
 
 
+# URLs derived from SUITE_CRM_INSTANCE_BASE_URL, built here once instead of on every call.
 SUITE_CRM_INSTANCE_REST_URL = SUITE_CRM_INSTANCE_BASE_URL + "/service/v4_1/rest.php"
 SUITE_CRM_INSTANCE_OAUTH_URL = SUITE_CRM_INSTANCE_BASE_URL + "/api/oauth/access_token"
+SUITE_CRM_INSTANCE_MODULES_URL = SUITE_CRM_INSTANCE_BASE_URL + "/api/v8/modules/"
+
+# Connection pool used for every call made to SuiteCRM (see suitecrm_client.py).
+# Number of per-host pools kept alive and the maximum connections kept in each of them.
+SUITE_CRM_POOL_CONNECTIONS = 4
+SUITE_CRM_POOL_MAXSIZE = 20
+# When True a request waits for a free pooled connection instead of opening an extra one.
+SUITE_CRM_POOL_BLOCK = False
+# Timeouts in seconds for opening a connection to SuiteCRM and for reading its response.
+SUITE_CRM_CONNECT_TIMEOUT = 2.0
+SUITE_CRM_READ_TIMEOUT = 6.0
+# Retries for idempotent GET requests only; backoff sleeps factor * (2 ** (retry - 1)) seconds.
+SUITE_CRM_MAX_RETRIES = 2
+SUITE_CRM_RETRY_BACKOFF_FACTOR = 0.2
+
+# In-process read cache in front of SuiteCRM GET calls (see cache.py).
+# Time to live in seconds of cached listings, per SuiteCRM module. Modules not listed here are not cached.
+SUITE_CRM_CACHE_TTL = {
+    "Leads": 60,
+    "Meetings": 30,
+    "Calls": 30,
+    "Tasks": 30,
+}
+SUITE_CRM_CACHE_MAX_ENTRIES = 1024
+SUITE_CRM_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# asyncio SuiteCRM client used by the ASGI entry point (see async_handler.py).
+# Maximum number of simultaneous connections, in total and to a single host.
+SUITE_CRM_ASYNC_POOL_LIMIT = 200
+SUITE_CRM_ASYNC_POOL_LIMIT_PER_HOST = 100
+
+# How a record created by post_request_details gets assigned to the requesting user:
+#   "inline"     - send assigned_user_id with the create request; if SuiteCRM does not honour it the
+#                  assignment PATCH runs in the background (one round-trip before Alexa answers).
+#   "deferred"   - create the record, then run the assignment PATCH in the background.
+#   "sequential" - create the record, then PATCH the assignment before answering (two round-trips).
+SUITE_CRM_ASSIGNMENT_MODE = "inline"
+# Attempts and base backoff in seconds (doubled on every retry) for background assignment calls.
+SUITE_CRM_ASSIGNMENT_MAX_ATTEMPTS = 4
+SUITE_CRM_ASSIGNMENT_RETRY_BACKOFF = 1.0
+
+# Worker threads running background work (deferred assignments, prefetches...).
+BACKGROUND_WORKERS = 4
+
+# Cache of decoded access tokens (see tokens.py), keyed by a hash of the token.
+TOKEN_CACHE_MAX_ENTRIES = 4096
+# Upper bound in seconds on how long decoded claims are kept; tokens are never kept past their expiry.
+TOKEN_CACHE_MAX_TTL = 3600
+# Seconds before 'exp' at which a token is already treated as expired, so it can't expire mid request.
+TOKEN_EXPIRY_LEEWAY = 10
+
+# Maximum length of the text Alexa will speak in one response; longer listings are cut at a row boundary.
+ALEXA_MAX_SPEECH_LENGTH = 8000
+
+# Number of records read per page by the listing intents, per SuiteCRM module.
+SUITE_CRM_PAGE_SIZE = {
+    "Leads": 5,
+    "Meetings": 5,
+    "Calls": 5,
+    "Tasks": 5,
+}
+# Fetch the next page in the background while the user listens to the current one.
+SUITE_CRM_PREFETCH_NEXT_PAGE = True
+
+# Time budget of one Alexa request (see deadline.py). Alexa waits this many seconds for an answer, counted
+# from the request timestamp; SuiteCRM calls get what is left minus a reserve for sending the response.
+ALEXA_RESPONSE_BUDGET = 8.0
+ALEXA_RESPONSE_RESERVE = 0.75
+# Budget left to a request however old its timestamp looks, so a server clock running ahead of Alexa's doesn't
+# leave every SuiteCRM call without time.
+ALEXA_MIN_RESPONSE_BUDGET = 1.5
+# With less than this many seconds left, a listing missing from the cache is not fetched before answering:
+# the skill answers from the stale cached copy (or asks the user to retry) and fetches it in the background.
+SUITE_CRM_MIN_FETCH_BUDGET = 1.0
+# Seconds an expired cached listing can still be served while SuiteCRM is slow or failing.
+SUITE_CRM_CACHE_STALE_GRACE = 300
+
+# Circuit breaker per SuiteCRM endpoint (see circuit_breaker.py): consecutive failures opening the circuit,
+# and seconds calls are rejected before a trial call is let through.
+SUITE_CRM_BREAKER_FAILURE_THRESHOLD = 5
+SUITE_CRM_BREAKER_RESET_TIMEOUT = 30.0
+
+# Batched record creation through the v4_1 REST API at SUITE_CRM_INSTANCE_REST_URL (see write_batcher.py).
+# Off by default, so every create is its own v8 POST. When on, creates of the same module are queued and sent
+# as one set_entries call once SUITE_CRM_WRITE_BATCH_SIZE records are waiting or SUITE_CRM_WRITE_BATCH_DELAY
+# seconds have passed. Batched records are always assigned inline through their assigned_user_id, taken from
+# an access token SuiteCRM has accepted once (see tokens.verify).
+SUITE_CRM_WRITE_BATCHING = False
+SUITE_CRM_WRITE_BATCH_SIZE = 20
+SUITE_CRM_WRITE_BATCH_DELAY = 0.05
+# Worker threads sending full batches, apart from BACKGROUND_WORKERS so prefetches and retries can't hold up a
+# batch that Alexa requests are waiting on.
+SUITE_CRM_WRITE_BATCH_WORKERS = 2
+# SuiteCRM user the v4_1 REST API logs in as to create batched records.
+SUITE_CRM_SERVICE_USER_NAME = "service_user"
+SUITE_CRM_SERVICE_USER_PASSWORD = "service_password"
+
+# Write here client_secret created in SuiteCRM portal under Oauth keys and client.
+SUITE_CRM_OAUTH_CLIENT_SECRET = "client_secret"
+# Timeout in seconds for reading the answer of the OAuth token endpoint (see auth_client.py).
+SUITE_CRM_OAUTH_READ_TIMEOUT = 5.0
+
+# Where cached listings are kept (see cache_backend.py):
+#   "memory" - in each worker process
+#   "sqlite" - in a SQLite file shared by the worker processes of one node, at CACHE_SQLITE_PATH
+#   "redis"  - in the Redis server at CACHE_REDIS_URL, shared by every node (needs the redis package)
+CACHE_BACKEND = "memory"
+CACHE_SQLITE_PATH = "/tmp/alexa-skill-cache.sqlite3"
+CACHE_REDIS_URL = "redis://localhost:6379/0"
+# Backend of the decoded access token cache. Decoding a token is cheaper than a lookup in a shared store,
+# so tokens stay in process memory unless set to CACHE_BACKEND.
+TOKEN_CACHE_BACKEND = "memory"
+# Seconds a process filling a missing shared cache entry holds the fill lock, and seconds other processes
+# wait for that fill before fetching the entry themselves.
+CACHE_FILL_LOCK_TTL = 10
+CACHE_FILL_WAIT = 2.0
+
+# Threads running the SuiteCRM calls of one request in parallel, e.g. the four listings of the daily
+# briefing (see fanout.py).
+FANOUT_WORKERS = 16
+
+# State kept between the turns of an Alexa session (see session_store.py): decoded token claims and the slots
+# filled so far by the create dialogs. States expire this many seconds after their last turn, and a worker
+# keeps at most SESSION_STORE_MAX_ENTRIES of them in SESSION_STORE_MAX_BYTES of memory. Turns of one session
+# can reach different workers, so set SESSION_STORE_BACKEND to a shared backend when running several.
+SESSION_STORE_TTL = 600
+SESSION_STORE_MAX_ENTRIES = 10000
+SESSION_STORE_MAX_BYTES = 16 * 1024 * 1024
+SESSION_STORE_BACKEND = CACHE_BACKEND
+
+# Warm-up of a new worker (see warmup.py): static responses are built, jwt imported and WARM_UP_CONNECTIONS
+# connections to SuiteCRM opened (aiohttp ones under ASGI) before the first Alexa request needs them.
+#   "blocking"   - before the worker serves requests
+#   "background" - in a thread, while the worker already serves requests
+#   "off"        - not at all; everything is prepared by the first requests using it
+WARM_UP_MODE = "blocking"
+WARM_UP_CONNECTIONS = 4
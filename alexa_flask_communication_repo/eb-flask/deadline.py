@@ -0,0 +1,117 @@
+"""
+Time budget of the Alexa request being handled.
+
+Alexa stops waiting for a skill a few seconds after the request timestamp. on_intent() stores the deadline of
+the request in a context variable, and every SuiteCRM call sizes its timeout with the time left. Calls of
+mutating intents keep their own timeouts instead: SuiteCRM completes a create even when the skill stops
+waiting for it, so cutting it short would only hide that it happened.
+"""
+import calendar
+import config
+import contextvars
+import time
+from datetime import datetime
+
+
+_deadline = contextvars.ContextVar('alexa_request_deadline', default=None)
+_caps_calls = contextvars.ContextVar('alexa_request_caps_calls', default=True)
+
+TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised instead of starting a SuiteCRM call that could not complete before the response is due.
+    """
+
+
+def parse_timestamp(timestamp):
+    """
+    Convert an Alexa request timestamp (ISO 8601 in UTC, e.g. '2018-08-03T10:15:00Z') to a Unix time.
+
+    :return: seconds since the epoch, or None when the timestamp is missing or malformed.
+    """
+    if not timestamp:
+        return None
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return calendar.timegm(datetime.strptime(timestamp, timestamp_format).utctimetuple())
+        except ValueError:
+            continue
+    return None
+
+
+def request_deadline(timestamp=None, timeout=None):
+    """
+    Monotonic clock time by which the response of a request has to be ready.
+
+    :param timestamp: request.timestamp of the Alexa request
+    :param timeout: optional time budget of the intent in seconds (IntentRoute.timeout)
+    """
+    budget = config.ALEXA_RESPONSE_BUDGET - config.ALEXA_RESPONSE_RESERVE
+    sent_at = parse_timestamp(timestamp)
+    if sent_at is not None:
+        # Clamped so a skewed clock can neither extend the budget nor shrink it below the minimum budget.
+        elapsed = min(max(time.time() - sent_at, 0.0), budget)
+        budget = max(budget - elapsed, min(config.ALEXA_MIN_RESPONSE_BUDGET, budget))
+    if timeout is not None:
+        budget = min(budget, timeout)
+    return time.monotonic() + budget
+
+
+def set_deadline(deadline, caps_calls=True):
+    """
+    :param caps_calls: False to leave the timeouts of SuiteCRM calls uncapped, e.g. for mutating intents
+    :return: token to pass to reset_deadline once the request is answered.
+    """
+    return _deadline.set(deadline), _caps_calls.set(caps_calls)
+
+
+def reset_deadline(token):
+    deadline_token, caps_calls_token = token
+    _caps_calls.reset(caps_calls_token)
+    _deadline.reset(deadline_token)
+
+
+def caps_calls():
+    """
+    :return: True when SuiteCRM calls of the current request are cut short at its deadline.
+    """
+    return _caps_calls.get()
+
+
+def remaining():
+    """
+    :return: seconds left before the current request's deadline, or None outside of a request.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired():
+    """
+    :return: True when the current request's deadline has passed, False outside of a request.
+    """
+    time_left = remaining()
+    return time_left is not None and time_left <= 0
+
+
+def call_timeout(default):
+    """
+    Timeout of one SuiteCRM call: the default (connect, read) timeouts capped at the time left, unless the
+    request doesn't cap its calls. No call is started once the deadline has passed.
+
+    :param default: tuple of (connect timeout, read timeout) in seconds
+    :return: tuple of (connect timeout, read timeout) in seconds
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("No time left to call SuiteCRM")
+    if not caps_calls():
+        return default
+    connect_timeout, read_timeout = default
+    return (min(connect_timeout, left), min(read_timeout, left))
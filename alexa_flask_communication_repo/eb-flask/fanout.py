@@ -0,0 +1,42 @@
+"""
+Parallel execution of the independent SuiteCRM calls answering one Alexa request.
+"""
+import config
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the process wide thread pool running the calls of run_parallel().
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=config.FANOUT_WORKERS)
+    return _executor
+
+
+def run_parallel(calls):
+    """
+    Run calls concurrently and wait for all of them, so the wall-clock time is the one of the slowest call.
+
+    The first call runs in the calling thread, the others in the pool, each in a copy of the caller's
+    context so they see the deadline of the current Alexa request.
+
+    :param calls: list of (callable, args tuple)
+    :return: list of the results, in the order of calls
+    """
+    if not calls:
+        return []
+    futures = [get_executor().submit(contextvars.copy_context().run, fn, *args) for fn, args in calls[1:]]
+    fn, args = calls[0]
+    results = [fn(*args)]
+    results.extend(future.result() for future in futures)
+    return results
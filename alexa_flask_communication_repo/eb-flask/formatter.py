@@ -0,0 +1,82 @@
+import re
+from functools import lru_cache
+
+
+PLACEHOLDER_PATTERN = re.compile(r'<([^<>]+)>')
+
+
+@lru_cache(maxsize=256)
+def compile_format(format_string, column_list):
+    """
+    Parse the <column> placeholders of a format string once.
+
+    :param format_string: string containing placeholders such as '<name> on <date_start>'
+    :param column_list: tuple of column names, in the order of the row values
+    :return: tuple of literal strings and column indexes, e.g. (0, ' on ', 1). Placeholders naming a
+     column that isn't in column_list are kept as literal text.
+    """
+    column_index = dict((column, index) for index, column in enumerate(column_list))
+    parts = []
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(format_string):
+        index = column_index.get(match.group(1))
+        if index is None:
+            continue
+        if match.start() > position:
+            parts.append(format_string[position:match.start()])
+        parts.append(index)
+        position = match.end()
+    if position < len(format_string):
+        parts.append(format_string[position:])
+    return tuple(parts)
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def render_row(parts, row):
+    return ''.join(part if isinstance(part, str) else _text(row[part] if part < len(row) else None)
+                   for part in parts)
+
+
+def format_rows(rows, prefix='', format_string='', column_list=(), max_length=None):
+    """
+    Render SuiteCRM rows into one sentence in a single pass.
+
+    Rows are consumed lazily and rendering stops at the last whole row fitting in max_length, so a long
+    listing is never materialised in full.
+
+    :param rows: iterable of row value sequences
+    :param prefix: string to be added at the start of the sentence
+    :param format_string: string containing <column> placeholders, rendered once per row followed by '.'
+    :param column_list: list of columns names. Without columns the first value of every row is listed,
+     separated by commas.
+    :param max_length: maximum length of the output, None for no limit
+    :return: formatted string
+    """
+    if not column_list:
+        pieces = [prefix + " "]
+        separator = ""
+        template = None
+    else:
+        pieces = [prefix]
+        separator = "."
+        template = compile_format(format_string, tuple(column_list))
+    length = len(pieces[0])
+    first = True
+    for row in rows:
+        if template is None:
+            if not row or row[0] is None:
+                continue
+            piece = _text(row[0]) if first else "," + _text(row[0])
+        elif not row:
+            continue
+        else:
+            piece = render_row(template, row) + separator
+        if max_length is not None and length + len(piece) > max_length:
+            break
+        pieces.append(piece)
+        length += len(piece)
+        first = False
+    return ''.join(pieces)
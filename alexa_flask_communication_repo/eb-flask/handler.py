@@ -1,9 +1,49 @@
+import background
+import cache_backend
+import circuit_breaker
+import concurrent.futures
 import config
-import isodate
-import json
-import jwt
-import requests
+import deadline
+import fanout
+import formatter
+import functools
+import json_codec
+import metrics
+import responses
+import session_store
+import singleflight
+import suitecrm_client
+import suitecrm_query
 import time
+import tokens
+import write_batcher
+from router import IntentRouter
+
+
+def listing_to_json(rows):
+    return {"rows": list(rows), "next_url": rows.next_url}
+
+
+def listing_from_json(data):
+    return SuiteCrmRows([tuple(row) for row in data["rows"]], next_url=data["next_url"])
+
+
+# Read cache for SuiteCRM listings, shared by every request handled by this process (or by every process
+# with a shared config.CACHE_BACKEND).
+suitecrm_list_cache = cache_backend.make_cache('suitecrm_lists', max_entries=config.SUITE_CRM_CACHE_MAX_ENTRIES,
+                                               max_bytes=config.SUITE_CRM_CACHE_MAX_BYTES,
+                                               stale_grace=config.SUITE_CRM_CACHE_STALE_GRACE,
+                                               encode=listing_to_json, decode=listing_from_json)
+
+ALEXA_REQUEST_SECONDS = metrics.histogram('alexa_request_seconds', 'End to end handling time of Alexa requests.',
+                                          ('type',))
+ALEXA_REQUEST_ERRORS = metrics.counter('alexa_request_errors_total',
+                                       'Alexa requests answered with the interruption message after an exception.',
+                                       ('type',))
+metrics.gauges('suitecrm_list_cache', 'SuiteCRM listing cache counters.', 'stat', suitecrm_list_cache.stats)
+metrics.gauges('token_cache', 'Decoded access token cache counters.', 'stat', tokens.cache_stats)
+metrics.gauges('background_tasks', 'Background task counters.', 'stat', background.task_stats)
+metrics.gauges('session_store', 'Session state store counters.', 'stat', session_store.stats)
 
 
 def isTimeFormat(input):
@@ -103,6 +143,7 @@ def build_response_for_dialog(message):
     return res
 
 
+@responses.static_response
 def continue_dialog():
     message = {
         'shouldEndSession': False,
@@ -120,6 +161,15 @@ def statement(title, body,should_end_session = True):
     return build_response_for_dialog(speechlet)
 
 
+def speech_response(title, output, reprompt_text, should_end_session, session_attributes=None):
+    """
+    Build a speechlet response (see build_speechlet_response).
+    """
+    return build_response(session_attributes or {}, build_speechlet_response(title, output, reprompt_text,
+                                                                             should_end_session))
+
+
+@responses.static_response
 def handle_session_end_request():
     """
     This is method to handle a request when CancelIntent or StopIntent is called.
@@ -135,6 +185,7 @@ def handle_session_end_request():
         card_title, speech_output, None, should_end_session))
 
 
+@responses.static_response
 def get_welcome_response():
     """ If we wanted to initialize the session to have some attributes we could
     add those here
@@ -152,6 +203,25 @@ def get_welcome_response():
         card_title, speech_output, reprompt_text, should_end_session))
 
 
+@responses.static_response
+def get_link_account_response():
+    """
+    This is method to ask the user to link their SuiteCRM account again, e.g. when the access token has expired.
+    """
+    speech_output = "Your SuiteCRM session has expired. Please link your account again in the Alexa app."
+    return build_response({}, {
+        "outputSpeech": {
+            "type": "PlainText",
+            "text": speech_output
+        },
+        "card": {
+            "type": "LinkAccount"
+        },
+        "shouldEndSession": True
+    })
+
+
+@responses.static_response
 def get_help_response():
     session_attributes = {}
     card_title = "Help"
@@ -163,11 +233,14 @@ def get_help_response():
         card_title, speech_output, reprompt_text, should_end_session))
 
 
-def format_suitecrm_response(data_list, prefix='',format_string = '',column_list=[]):
+def format_suitecrm_response(data_list, prefix='',format_string = '',column_list=[], max_length=None):
     """
     This method is used to beautify the data, coming as a response from SuiteCRM API call, in structured sentences.
 
-    :param data_list: list containg data to be beautify.
+    The format string is compiled once and cached, rows are rendered in a single pass and the output is
+    cut at the last whole row fitting in max_length (see formatter.format_rows).
+
+    :param data_list: list or iterable containg data to be beautify.
         :type: list
     :param prefix: string to be added at the start of the sentence.
         :type: string
@@ -175,24 +248,14 @@ def format_suitecrm_response(data_list, prefix='',format_string = '',column_list
         :type: string
     :param column_list: list of columns names.
         :type: list
+    :param max_length: maximum length of the output, config.ALEXA_MAX_SPEECH_LENGTH by default.
+        :type: int
     :return:
     """
-    output_text = ""
-    if not column_list:
-        response_list = []
-        for each_data in data_list:
-            response_list.append(each_data[0])
-        output_text += prefix + " " + (",".join(response_list))
-    else:
-        output_text = prefix
-        for data_key, data_value in enumerate(data_list):
-            format_new = format_string
-            lstindex = len(data_value)
-            for data_sub_key, data_sub_value in enumerate(data_value):
-                format_new = format_new.replace('<' + column_list[data_sub_key] + '>', data_sub_value)
-                if data_sub_key == (lstindex - 1):
-                    output_text += format_new + '.'
-    return output_text
+    if max_length is None:
+        max_length = config.ALEXA_MAX_SPEECH_LENGTH
+    with metrics.span('format'):
+        return formatter.format_rows(data_list, prefix, format_string, column_list, max_length)
 
 
 def check_no_error(json_response_data):
@@ -215,11 +278,225 @@ def change_url(url_string):
     return url_string.replace(config.SUITE_CRM_INSTANCE_IP_URL,config.SUITE_CRM_INSTANCE_BASE_URL)
 
 
+def session_subject(session, header_authorization_token):
+    """
+    Return the SuiteCRM user id ('sub' claim) of an access token, read from the claims kept in the session
+    state, or None when the token can't be decoded.
+    """
+    claims = session_store.claims(session, header_authorization_token)
+    return claims.sub if claims is not None else None
+
+
+def list_cache_tag(token_key, module_name):
+    return (token_key, module_name)
+
+
+def invalidate_list_cache(header_authorization_token, module_name):
+    """
+    Drop the cached listings of a module read with one access token, e.g. after its user created a new record.
+    """
+    return suitecrm_list_cache.invalidate_tag(list_cache_tag(tokens.token_key(header_authorization_token), module_name))
+
+
+class SuiteCrmRows(list):
+    """
+    Rows of one page of a SuiteCRM listing. next_url is the link to the next page, None on the last page.
+    """
+
+    def __init__(self, rows=(), next_url=None):
+        list.__init__(self, rows)
+        self.next_url = next_url
+
+
+def parse_suitecrm_list(suitecrm_data, column_list):
+    """
+    Keep only the requested columns of every record of a decoded SuiteCRM listing.
+
+    :return: SuiteCrmRows of column value tuples, or a string describing why there is no data.
+    """
+    check_error_response = check_no_error(suitecrm_data)
+    if isinstance(check_error_response, bool):
+        if suitecrm_data:
+            suitecrm_data_list = suitecrm_data.get("data")
+            if suitecrm_data_list is not None:
+                output_response = SuiteCrmRows(suitecrm_query.project_rows(suitecrm_data_list, column_list),
+                                               next_url=(suitecrm_data.get("links") or {}).get("next"))
+            else:
+                output_response = "No data to show"
+    else:
+        output_response = check_error_response
+    return output_response
+
+
+suitecrm_reads = singleflight.SingleFlight()
+metrics.gauges('suitecrm_read_coalescing', 'SuiteCRM listing GETs sent and coalesced into one in flight.', 'stat',
+               suitecrm_reads.stats)
+
+
+def read_key(url, header, column_list):
+    """
+    Key of a listing GET for coalescing: identical URL, columns and access token get the same rows.
+
+    The token itself (by its hash) is part of the key rather than its unverified 'sub' claim, so a GET only
+    joins a call sent with the very token SuiteCRM checks.
+    """
+    header_authorization_token = header.get("Authorization", "")[len("Bearer "):]
+    return url, tuple(column_list), tokens.token_key(header_authorization_token)
+
+
+def get_suitecrm_list(url, header, column_list):
+    suitecrm_response = suitecrm_client.get(url, headers=header)
+    return parse_suitecrm_list(json_codec.loads(suitecrm_response.content), column_list)
+
+
+def fetch_suitecrm_list(url, header, column_list):
+    """
+    GET a SuiteCRM listing and keep only the requested columns of every record.
+
+    Identical GETs made at the same time share one call to SuiteCRM: every caller gets the rows (or the
+    error) of that call once it returns. The shared rows must not be modified. A caller waits for a call made
+    by someone else (maybe a background refresh without deadline) only until its own deadline.
+
+    :raises: deadline.DeadlineExceeded when the shared call doesn't return before the caller's deadline.
+    """
+    try:
+        return suitecrm_reads.do(read_key(url, header, column_list), get_suitecrm_list, url, header, column_list,
+                                 timeout=deadline.remaining())
+    except concurrent.futures.TimeoutError:
+        raise deadline.DeadlineExceeded("No time left to wait for the listing")
+
+
+def fields_url(url, column_list, module_name):
+    """
+    Append the sparse fieldset of the requested columns to a listing URL.
+    """
+    if column_list:
+        url += '&fields[{0}]={1}'.format(module_name, (','.join(column_list)))
+    return url
+
+
+def listing_request(url, column_list, module_name):
+    """
+    Resolve the target of a GET call_suitecrm_api: a suitecrm_query.Query carries its own columns and module,
+    a plain URL gets the sparse fieldset of column_list appended.
+
+    :return: tuple of (url, column_list, module_name)
+    """
+    if isinstance(url, suitecrm_query.Query):
+        return url.url(), list(url.field_names), url.module_name
+    return fields_url(url, column_list, module_name), column_list, module_name
+
+
+def suitecrm_headers(header_authorization_token):
+    return {
+        "Content-Type": "application/vnd.api+json",
+        "Accept": "application/vnd.api+json",
+        "Authorization": "Bearer " + str(header_authorization_token)
+    }
+
+
+def list_cache_entry(url, header_authorization_token, column_list, module_name):
+    """
+    Work out how a GET listing is cached.
+
+    Listings are cached per access token (by its hash), not per 'sub' claim: the token's signature isn't
+    checked here, so only SuiteCRM, which answered the GET that filled the entry, vouches for it. Intents
+    whose route isn't cacheable always read SuiteCRM.
+
+    :return: tuple of (cache key, ttl, tag), or None when the listing must not be cached.
+    """
+    cache_ttl = config.SUITE_CRM_CACHE_TTL.get(module_name)
+    if not cache_ttl or not header_authorization_token:
+        return None
+    route = router.current_route()
+    if route is not None and not route.cacheable:
+        return None
+    token_key = tokens.token_key(header_authorization_token)
+    return (token_key, module_name, url, tuple(column_list)), cache_ttl, list_cache_tag(token_key, module_name)
+
+
+SUITE_CRM_PENDING_TEXT = "SuiteCRM is taking a while to answer. Ask me again in a moment."
+SUITE_CRM_UNAVAILABLE_TEXT = "SuiteCRM is not reachable right now. Please try again later."
+# Answer to a batched create still waiting for its batch: the record may yet be created, so asking again
+# could create it twice.
+SUITE_CRM_CREATE_PENDING_TEXT = "Your request is still being processed. Please don't ask again, it will be saved shortly."
+
+
+def refresh_listing(url, header, column_list, cache_entry):
+    """
+    GET a listing and store it in the read cache. Run in the background, outside of any request deadline.
+    """
+    cache_key, cache_ttl, cache_tag = cache_entry
+    output_response = fetch_suitecrm_list(url, header, column_list)
+    if isinstance(output_response, list):
+        suitecrm_list_cache.set(cache_key, output_response, cache_ttl, tags=[cache_tag])
+    return output_response
+
+
+def degraded_listing(url, header, column_list, cache_entry, error):
+    """
+    Answer for a cached listing SuiteCRM could not return in time.
+
+    The listing is fetched again in the background (unless the endpoint's circuit is open) so that the
+    user's next request finds it in the cache.
+
+    :param error: one of suitecrm_client.UNAVAILABLE_ERRORS
+    :return: stale cached rows when there are any, otherwise a string asking the user to try again.
+    """
+    circuit_open = isinstance(error, circuit_breaker.CircuitOpenError)
+    if not circuit_open:
+        background.submit(refresh_listing, url, header, column_list, cache_entry)
+    stale_response = suitecrm_list_cache.get_stale(cache_entry[0])
+    if stale_response is not None:
+        return stale_response
+    return SUITE_CRM_UNAVAILABLE_TEXT if circuit_open else SUITE_CRM_PENDING_TEXT
+
+
+def uncached_listing_error_text(error):
+    """
+    Answer for a listing that isn't cached and that SuiteCRM could not return.
+    """
+    if isinstance(error, deadline.DeadlineExceeded):
+        return SUITE_CRM_PENDING_TEXT
+    return SUITE_CRM_UNAVAILABLE_TEXT
+
+
+def fetch_listing(url, header, column_list, cache_entry=None):
+    """
+    GET a listing within the time left for the current Alexa request.
+
+    Listings that are cached but can't be fetched in time are answered by degraded_listing(); listings that
+    are not cached are answered with SUITE_CRM_PENDING_TEXT when SuiteCRM is only slow and with
+    SUITE_CRM_UNAVAILABLE_TEXT when it fails.
+    """
+    try:
+        if cache_entry is None:
+            return fetch_suitecrm_list(url, header, column_list)
+        time_left = deadline.remaining()
+        if time_left is not None and time_left < config.SUITE_CRM_MIN_FETCH_BUDGET:
+            raise deadline.DeadlineExceeded("Not enough time left to fetch the listing")
+        output_response = fetch_suitecrm_list(url, header, column_list)
+    except suitecrm_client.UNAVAILABLE_ERRORS as e:
+        if cache_entry is None:
+            return uncached_listing_error_text(e)
+        return degraded_listing(url, header, column_list, cache_entry, e)
+    if isinstance(output_response, list):
+        cache_key, cache_ttl, cache_tag = cache_entry
+        suitecrm_list_cache.set(cache_key, output_response, cache_ttl, tags=[cache_tag])
+    return output_response
+
+
 def call_suitecrm_api(url,request_type, header_authorization_token, column_list=[],module_name=False,request_post_body={}):
     """
     This method allows to call SuiteCRMs API.
 
-    :param url: request URL
+    GET listings of the modules configured in config.SUITE_CRM_CACHE_TTL are served from an in-process
+    cache keyed by the token subject, module, request URL (filters and paging) and column list. When
+    SuiteCRM is too slow for the request's deadline they are answered from the stale cache instead.
+    Identical GETs in flight at the same time, cached or not, share one call (see fetch_suitecrm_list).
+
+    :param url: request URL, or suitecrm_query.Query of a GET listing (then column_list and module_name are
+     taken from the query)
     :param request_type: type of request i.e GET/POST/PATCH
     :param header_authorization_token: authentication token
     :param column_list: list of requested columns
@@ -228,80 +505,398 @@ def call_suitecrm_api(url,request_type, header_authorization_token, column_list=
 
     :return: JSON object containing response from API call.
     """
-    header = {
-        "Content-Type": "application/vnd.api+json",
-        "Accept": "application/vnd.api+json",
-        "Authorization": "Bearer " + str(header_authorization_token)
-    }
+    header = suitecrm_headers(header_authorization_token)
     if request_type == 'GET':
-        if column_list:
-            url += '&fields[{0}]={1}'.format(module_name, (','.join(column_list)))
-        suitecrm_response = requests.get(url, headers=header)
-        suitecrm_data = json.loads(suitecrm_response.text)
-        check_error_response = check_no_error(suitecrm_data)
-        if isinstance(check_error_response, bool):
-            if suitecrm_data:
-                suitecrm_data_list = suitecrm_data.get("data")
-                if suitecrm_data_list is not None:
-                    output_response = []
-                    for each_data_element in suitecrm_data_list:
-                        attribute_dict = each_data_element.get("attributes")
-                        attr_value_list = []
-                        for column in column_list:
-                            attr_value_list.append(attribute_dict.get(column))
-                        output_response.append(attr_value_list)
-                else:
-                    output_response = "No data to show"
-        else:
-            output_response = check_error_response
+        url, column_list, module_name = listing_request(url, column_list, module_name)
+        cache_entry = list_cache_entry(url, header_authorization_token, column_list, module_name)
+        if cache_entry is None:
+            return fetch_listing(url, header, column_list)
+        try:
+            output_response = suitecrm_list_cache.get_or_fill(cache_entry[0], functools.partial(
+                fetch_listing, url, header, column_list, cache_entry), timeout=deadline.remaining())
+        except concurrent.futures.TimeoutError:
+            # The fill this request joined (maybe a background prefetch without deadline) is still running.
+            output_response = degraded_listing(url, header, column_list, cache_entry, deadline.DeadlineExceeded(
+                "No time left to wait for the listing"))
     elif request_type == 'POST':
-        suitecrm_response = requests.post(url, data= json.dumps(request_post_body) ,headers=header)
-        output_response = json.loads(suitecrm_response.text)
+        suitecrm_response = suitecrm_client.post(url, data= json_codec.dumps(request_post_body) ,headers=header)
+        output_response = json_codec.loads(suitecrm_response.content)
     elif request_type == 'PATCH':
-        suitecrm_response = requests.patch(url, data=json.dumps(request_post_body), headers=header)
-        output_response = json.loads(suitecrm_response.text)
+        suitecrm_response = suitecrm_client.patch(url, data=json_codec.dumps(request_post_body), headers=header)
+        output_response = json_codec.loads(suitecrm_response.content)
     return output_response
 
 
-def get_leads(intent,token_data):
+LEAD_COLUMNS = ['name']
+MEETING_COLUMNS = ['name', 'date_start']
+LEAD_POST_PARAMS = ['first_name', 'last_name', 'description']
+MEETING_POST_PARAMS = ['name','date', 'time', 'description','duration']
+
+
+def module_url(module_name):
+    return config.SUITE_CRM_INSTANCE_MODULES_URL + module_name
+
+
+def next_page_attributes(intent_name, suitecrm_data, page_number, **filters):
+    """
+    Session attributes carrying the cursor of the next page of a listing, read back by SugarCrmNextPageIntent.
+
+    :return: Dictionary with a 'nextPage' cursor, empty when there is no next page.
+    """
+    if not getattr(suitecrm_data, 'next_url', None):
+        return {}
+    cursor = {"intent": intent_name, "page": page_number + 1}
+    cursor.update((name, value) for name, value in filters.items() if value)
+    return {"nextPage": cursor}
+
+
+def prefetch_page(query, header_authorization_token):
+    """
+    Load a listing page into the read cache in the background, so asking for it later doesn't wait on SuiteCRM.
+
+    :param query: suitecrm_query.Query of the page
+    """
+    if config.SUITE_CRM_PREFETCH_NEXT_PAGE and config.SUITE_CRM_CACHE_TTL.get(query.module_name):
+        background.submit(call_suitecrm_api, query, 'GET', header_authorization_token)
+
+
+def listing_text(output_text, session_attributes):
+    if session_attributes.get("nextPage"):
+        output_text += " Say next to hear more."
+    return output_text
+
+
+def leads_query(page_number=1):
+    return suitecrm_query.Query('Leads').fields(*LEAD_COLUMNS).page(page_number)
+
+
+def leads_response(intent, suitecrm_lead_data, page_number=1):
+    """
+    Build the Alexa response for a list of leads returned by call_suitecrm_api.
+    """
+    session_attributes = next_page_attributes("SugarCrmLeadRequestIntent", suitecrm_lead_data, page_number)
+    if not isinstance(suitecrm_lead_data,str):
+        output_text = listing_text(format_suitecrm_response(suitecrm_lead_data,"The list of leads is as follows : "),
+                                   session_attributes)
+    else:
+        output_text = suitecrm_lead_data
+    return speech_response(intent['name'], output_text, output_text, False, session_attributes)
+
+
+def get_leads(intent,token_data, page_number=1):
     """
     Get List of leads.
 
     :param intent: name of the intent
     :param token_data: authentication token
+    :param page_number: page of the listing to read
     """
-    url = config.SUITE_CRM_INSTANCE_BASE_URL + "/api/v8/modules/Leads?page[limit]=5"
-    suitecrm_lead_data = call_suitecrm_api(url,'GET',token_data,['name'],'Leads')
-    if not isinstance(suitecrm_lead_data,str):
-        output_text = format_suitecrm_response(suitecrm_lead_data,"The list of leads is as follows : ")
+    suitecrm_lead_data = call_suitecrm_api(leads_query(page_number),'GET',token_data)
+    if getattr(suitecrm_lead_data, 'next_url', None):
+        prefetch_page(leads_query(page_number + 1), token_data)
+    return leads_response(intent, suitecrm_lead_data, page_number)
+
+
+def meeting_date(intent):
+    """
+    Value of the optional datevalue slot of a meeting request, or None.
+    """
+    datevalue = (intent.get('slots') or {}).get("datevalue")
+    if datevalue and datevalue.get('value'):
+        return datevalue.get('value')
+    return None
+
+
+def meetings_query(requested_date=None, page_number=1):
+    query = suitecrm_query.Query('Meetings').fields(*MEETING_COLUMNS).page(page_number)
+    if requested_date:
+        query.starts_with('date_start', requested_date)
+    return query
+
+
+def meetings_response(intent, suitecrm_meeting_data, page_number=1, requested_date=None):
+    """
+    Build the Alexa response for a list of meetings returned by call_suitecrm_api.
+    """
+    session_attributes = next_page_attributes("SugarCrmGetMeetingIntent", suitecrm_meeting_data, page_number,
+                                              date=requested_date)
+    if not isinstance(suitecrm_meeting_data, str):
+        format_string = '<name> on <date_start>'
+        output_text = listing_text(format_suitecrm_response(suitecrm_meeting_data, "The list of meetings is as follows : ",
+                                                            format_string,MEETING_COLUMNS), session_attributes)
     else:
-        output_text = suitecrm_lead_data
-    return build_response({}, build_speechlet_response(
-        intent['name'], output_text, output_text, False))
+        output_text = suitecrm_meeting_data
+    return speech_response(intent['name'], output_text, output_text, False, session_attributes)
 
 
-def get_meetings(intent, token_data):
+def get_meetings(intent, token_data, page_number=1, requested_date=None):
     """
         Get List of meetings.
 
         :param intent: name of the intent
         :param token_data: authentication token
+        :param page_number: page of the listing to read
+        :param requested_date: date filter, read from the datevalue slot when not given
         """
-    url = config.SUITE_CRM_INSTANCE_BASE_URL + "/api/v8/modules/Meetings?page[limit]=5"
-    if intent.get('slots').get("datevalue") and intent.get('slots').get("datevalue").get('value'):
-        requested_date = intent.get('slots').get("datevalue").get('value')
-        url +="&filter[Meetings.date_start]=[[li]]{0}%".format(requested_date)
-    suitecrm_lead_data = call_suitecrm_api(url, 'GET', token_data, ['name','date_start'], 'Meetings')
-    if not isinstance(suitecrm_lead_data, str):
-        format_string = '<name> on <date_start>'
-        output_text = format_suitecrm_response(suitecrm_lead_data, "The list of meetings is as follows : ",format_string,['name','date_start'])
-    else:
-        output_text = suitecrm_lead_data
+    if requested_date is None:
+        requested_date = meeting_date(intent)
+    suitecrm_meeting_data = call_suitecrm_api(meetings_query(requested_date, page_number), 'GET', token_data)
+    if getattr(suitecrm_meeting_data, 'next_url', None):
+        prefetch_page(meetings_query(requested_date, page_number + 1), token_data)
+    return meetings_response(intent, suitecrm_meeting_data, page_number, requested_date)
+
+
+def next_page_cursor(session):
+    """
+    Cursor of the next page stored in the session attributes by the previous listing, or None.
+    """
+    return (session.get('attributes') or {}).get('nextPage')
+
+
+@responses.static_response
+def get_no_more_results_response():
+    speech_output = "There are no more results. You can ask me for your leads or meetings."
     return build_response({}, build_speechlet_response(
-        intent['name'], output_text, output_text, False))
+        "Next page", speech_output, speech_output, False))
+
+
+CALL_COLUMNS = ['name', 'date_start']
+TASK_COLUMNS = ['name', 'date_due']
+
+# (module, date field filtered on, columns, prefix, format string) of every part of the daily briefing.
+# Sections without format string list the first column separated by commas.
+BRIEFING_SECTIONS = (
+    ('Leads', None, LEAD_COLUMNS, "Your leads are : ", ''),
+    ('Meetings', 'date_start', MEETING_COLUMNS, "Your meetings are : ", '<name> on <date_start>'),
+    ('Calls', 'date_start', CALL_COLUMNS, "Your calls are : ", '<name> at <date_start>'),
+    ('Tasks', 'date_due', TASK_COLUMNS, "Your tasks are : ", '<name> due on <date_due>'),
+)
+
+
+def briefing_query(section, requested_date):
+    module_name, date_field, column_list = section[0], section[1], section[2]
+    query = suitecrm_query.Query(module_name).fields(*column_list).page(1)
+    if date_field:
+        query.starts_with(date_field, requested_date)
+    return query
+
+
+def briefing_queries(requested_date):
+    """
+    Query of every section of the daily briefing.
+
+    :return: list of (section, suitecrm_query.Query) tuples
+    """
+    return [(section, briefing_query(section, requested_date)) for section in BRIEFING_SECTIONS]
+
+
+def briefing_section_text(section, suitecrm_data, max_length):
+    module_name, date_field, column_list, prefix, format_string = section
+    if isinstance(suitecrm_data, str):
+        return "{0}: {1}.".format(module_name, suitecrm_data.rstrip('.'))
+    if not suitecrm_data:
+        return "You have no {0}.".format(module_name.lower())
+    if format_string:
+        return format_suitecrm_response(suitecrm_data, prefix, format_string, column_list, max_length)
+    return format_suitecrm_response(suitecrm_data, prefix, format_string, [], max_length - 1) + "."
+
+
+def briefing_response(intent, suitecrm_results):
+    """
+    Build the Alexa response of the daily briefing from the listings of every section, in section order.
+
+    The whole text is kept within config.ALEXA_MAX_SPEECH_LENGTH: every section gets an equal share of the
+    length left, and what a short section doesn't use goes to the sections after it.
+    """
+    texts = []
+    length_left = config.ALEXA_MAX_SPEECH_LENGTH - (len(BRIEFING_SECTIONS) - 1)
+    for index, (section, suitecrm_data) in enumerate(zip(BRIEFING_SECTIONS, suitecrm_results)):
+        text = briefing_section_text(section, suitecrm_data, length_left // (len(BRIEFING_SECTIONS) - index))
+        texts.append(text)
+        length_left -= len(text)
+    output_text = " ".join(texts)
+    return speech_response(intent['name'], output_text, output_text, False)
+
+
+def get_briefing(intent, token_data):
+    """
+    Read the user's leads and the meetings, calls and tasks of the requested day (today by default) with
+    parallel SuiteCRM calls, and answer them in a single response.
+
+    The day comes from the datevalue slot, which Alexa resolves in the user's time zone; without it the
+    server's date is used.
+
+    :param intent: name of the intent with slot information
+    :param token_data: authentication token
+    """
+    requested_date = meeting_date(intent) or time.strftime('%Y-%m-%d')
+    suitecrm_results = fanout.run_parallel([
+        (call_suitecrm_api, (query, 'GET', token_data)) for section, query in briefing_queries(requested_date)])
+    return briefing_response(intent, suitecrm_results)
+
+
+def collect_slot_values(intent, param_list, merge_datetime, remembered_slots=None):
+    """
+    Read the values of the requested slots, converting meeting date, time and duration slots into
+    SuiteCRM's date_start/duration_hours/duration_minutes attributes when merge_datetime is set.
+
+    :param remembered_slots: slot values kept from earlier turns of the dialog, used for slots the
+                             request leaves empty.
+    :return: Dictionary of SuiteCRM attributes.
+    """
+    remembered_slots = remembered_slots or {}
+    param_key_val_dict = {}
+    for each_param in param_list:
+        value = (intent.get('slots').get(each_param) or {}).get('value')
+        if value is None:
+            value = remembered_slots.get(each_param)
+        param_key_val_dict[each_param] = value
+    if merge_datetime:
+        is_time = isTimeFormat(param_key_val_dict.get("time"))
+        if is_time:
+            meeting_time = param_key_val_dict.get("time") + ':00'
+        else:
+            meeting_time = "00:00:00"
+        param_key_val_dict['date_start'] = param_key_val_dict.get("date") + " " + meeting_time
+        param_key_val_dict.pop('date',None)
+        param_key_val_dict.pop('time',None)
+
+        duration = param_key_val_dict.get("duration")
+        # isodate is only needed by meeting creation, so it is not loaded with the module.
+        import isodate
+        new_time = isodate.parse_duration(duration)
+        days, seconds = new_time.days, new_time.seconds
+        hours = seconds // 3600
+        minutes = (seconds % 3600) // 60
+        param_key_val_dict['duration_hours'] = int(hours)
+        param_key_val_dict['duration_minutes'] = int(minutes)
+        param_key_val_dict.pop('duration', None)
+    return param_key_val_dict
+
+
+def create_request_body(module_name, param_key_val_dict, user_db_id=None):
+    """
+    Build the create request of a record. In "inline" assignment mode the record is assigned to the
+    user within the same request.
+    """
+    if user_db_id and config.SUITE_CRM_ASSIGNMENT_MODE == "inline":
+        param_key_val_dict = dict(param_key_val_dict, assigned_user_id=user_db_id)
+    return {
+                "data": {
+                    "type": module_name,
+                    "attributes": param_key_val_dict
+                }
+            }
+
+
+def creation_error_response(intent, result):
+    """
+    Return the Alexa response describing a failed create call, or None when the record was created.
+    """
+    if result.get("errors") or result.get("error"):
+        if result.get("error") == "access_denied":
+            return statement(intent.get("name"),result.get("error"))
+        else:
+            return statement(intent.get("name"), "Error in request creation. Reason "+(result.get("message") if result.get("message") else 'Not specified' ))
+    return None
+
+
+def assign_user_request(result, user_db_id):
+    """
+    Build the PATCH request assigning a freshly created record to the user.
+
+    :param result: JSON response of the create call
+    :param user_db_id: SuiteCRM id of the user
+
+    :return: tuple of (request url, request body)
+    """
+    assigned_user_url = result.get("data").get("relationships").get("assigned_user_link").get("links").get("related")
+    changed_url = change_url(assigned_user_url)
+    request_body ={
+                    "data": {
+                            "type": "Users",
+                            "id": user_db_id,
+                            "links": {
+                                "href": config.SUITE_CRM_INSTANCE_MODULES_URL+"Users/"+str(user_db_id)
+                            }
+                    }
+                    }
+    return changed_url, request_body
+
+
+def assignment_pending(result, user_db_id):
+    """
+    Check whether a created record still has to be assigned to the user with a separate PATCH.
+
+    :param result: JSON response of the create call
+    :param user_db_id: SuiteCRM id of the user
+    """
+    if config.SUITE_CRM_ASSIGNMENT_MODE == "inline" or config.SUITE_CRM_WRITE_BATCHING:
+        attributes = result.get("data").get("attributes") or {}
+        return attributes.get("assigned_user_id") != user_db_id
+    return True
+
+
+def batched_create_timeout():
+    """
+    Seconds to wait for the result of a batched create: the time left for the Alexa request, or the batch
+    delay plus the read timeout outside of one.
+    """
+    time_left = deadline.remaining()
+    if time_left is None:
+        return config.SUITE_CRM_WRITE_BATCH_DELAY + config.SUITE_CRM_READ_TIMEOUT
+    return max(time_left, 0)
+
+
+def token_check_url(module_name):
+    """
+    URL of the GET checking an access token before a batched create: one record of the module being created.
+    """
+    return suitecrm_query.Query(module_name).fields('name').page(1, 1).url()
+
+
+def create_record(url, header_authorization_token, module_name, param_key_val_dict, user_db_id):
+    """
+    Create a record with a v8 POST, or through the write batcher when config.SUITE_CRM_WRITE_BATCHING is on.
+    A batched create is only queued once SuiteCRM has accepted the access token its user id comes from.
+
+    :return: JSON response of the create call
+    :raises: tokens.TokenRejected when SuiteCRM refuses the token of a batched create,
+             write_batcher.CreatePending when a batched create is still queued at the deadline.
+    """
+    if config.SUITE_CRM_WRITE_BATCHING:
+        tokens.verify(header_authorization_token, token_check_url(module_name))
+        future = write_batcher.submit_create(module_name, param_key_val_dict, user_db_id)
+        try:
+            return future.result(timeout=batched_create_timeout())
+        except concurrent.futures.TimeoutError:
+            raise write_batcher.CreatePending("Batched create still queued at the deadline")
+    request_body = create_request_body(module_name, param_key_val_dict, user_db_id)
+    return call_suitecrm_api(url,'POST',header_authorization_token,request_post_body=request_body)
+
+
+def assign_user(url, header_authorization_token, request_body):
+    """
+    Send the assignment PATCH built by assign_user_request. Raises ValueError when SuiteCRM refuses it.
+    """
+    result = call_suitecrm_api(url, 'PATCH', header_authorization_token, request_post_body=request_body)
+    if result.get("errors") or result.get("error"):
+        raise ValueError("Assignment failed: " + str(result.get("message") or result.get("errors") or result.get("error")))
+    return result
+
+
+def schedule_assignment(url, header_authorization_token, request_body):
+    """
+    Run the assignment PATCH in the background, retrying it with backoff when it fails.
+    """
+    return background.submit_with_retry("assign_user " + url, assign_user,
+                                        (url, header_authorization_token, request_body),
+                                        max_attempts=config.SUITE_CRM_ASSIGNMENT_MAX_ATTEMPTS,
+                                        backoff=config.SUITE_CRM_ASSIGNMENT_RETRY_BACKOFF)
 
 
-def post_request_details(intent,intent_dialogState,param_list,url,header_authorization_token,module_name,merge_datetime):
+def post_request_details(intent,intent_dialogState,param_list,url,header_authorization_token,module_name,merge_datetime,
+                         session=None):
     """
     Method used to post a data into SuiteCRM.
 
@@ -312,64 +907,36 @@ def post_request_details(intent,intent_dialogState,param_list,url,header_authori
     :param header_authorization_token: authentication token
     :param module_name: name of the module on which URL is operating.
     :param merge_datetime: boolean value whether to concatenate date and time or not.
+    :param session: session object of the request, whose state keeps the slots of earlier turns.
 
     :return: JSON object
     """
     if intent_dialogState in ("STARTED", "IN_PROGRESS"):
+        session_store.remember_slots(session, intent)
         return continue_dialog()
     elif intent_dialogState == "COMPLETED":
+        remembered_slots = session_store.remembered_slots(session, intent.get("name"))
+        session_store.forget_slots(session, intent.get("name"))
         if intent.get("confirmationStatus") == "CONFIRMED":
-            param_key_val_dict = {}
-            for each_param in param_list:
-                param_key_val_dict[each_param] = intent.get('slots').get(each_param).get('value')
-            if merge_datetime:
-                is_time = isTimeFormat(param_key_val_dict.get("time"))
-                if is_time:
-                    meeting_time = param_key_val_dict.get("time") + ':00'
-                else:
-                    meeting_time = "00:00:00"
-                param_key_val_dict['date_start'] = param_key_val_dict.get("date") + " " + meeting_time
-                param_key_val_dict.pop('date',None)
-                param_key_val_dict.pop('time',None)
-
-                duration = param_key_val_dict.get("duration")
-                new_time = isodate.parse_duration(duration)
-                days, seconds = new_time.days, new_time.seconds
-                hours = seconds // 3600
-                minutes = (seconds % 3600) // 60
-                param_key_val_dict['duration_hours'] = int(hours)
-                param_key_val_dict['duration_minutes'] = int(minutes)
-                param_key_val_dict.pop('duration', None)
-            payload = jwt.decode(header_authorization_token, verify=False)
-            if payload:
-                user_db_id = payload.get('sub')
+            param_key_val_dict = collect_slot_values(intent, param_list, merge_datetime, remembered_slots)
+            user_db_id = session_subject(session, header_authorization_token)
             try:
-                request_body = {
-                                    "data": {
-                                        "type": module_name,
-                                        "attributes": param_key_val_dict
-                                    }
-                                }
-                result = call_suitecrm_api(url,'POST',header_authorization_token,request_post_body=request_body)
-                if result.get("errors") or result.get("error"):
-                    if result.get("error") == "access_denied":
-                        return statement(intent.get("name"),result.get("error"))
+                result = create_record(url, header_authorization_token, module_name, param_key_val_dict, user_db_id)
+                error_response = creation_error_response(intent, result)
+                if error_response is not None:
+                    return error_response
+                invalidate_list_cache(header_authorization_token, module_name)
+                if assignment_pending(result, user_db_id):
+                    changed_url, request_body = assign_user_request(result, user_db_id)
+                    if config.SUITE_CRM_ASSIGNMENT_MODE == "sequential":
+                        result = call_suitecrm_api(changed_url, 'PATCH', header_authorization_token, request_post_body=request_body)
                     else:
-                        return statement(intent.get("name"), "Error in request creation. Reason "+(result.get("message") if result.get("message") else 'Not specified' ))
-                else:
-                    assigned_user_url = result.get("data").get("relationships").get("assigned_user_link").get("links").get("related")
-                    changed_url = change_url(assigned_user_url)
-                    request_body ={
-                                    "data": {
-                                            "type": "Users",
-                                            "id": user_db_id,
-                                            "links": {
-                                                "href": config.SUITE_CRM_INSTANCE_BASE_URL+"/api/v8/modules/Users/"+str(user_db_id)
-                                            }
-                                    }
-                                    }
-                    result = call_suitecrm_api(changed_url, 'PATCH', header_authorization_token, request_post_body=request_body)
-                    return statement(intent.get("name"), "Succesfully created",should_end_session=False)
+                        schedule_assignment(changed_url, header_authorization_token, request_body)
+                return statement(intent.get("name"), "Succesfully created",should_end_session=False)
+            except write_batcher.CreatePending:
+                return statement(intent.get("name"), SUITE_CRM_CREATE_PENDING_TEXT)
+            except tokens.TokenRejected:
+                return get_link_account_response()
             except Exception as e:
                 return statement(intent.get("name"), "Inside try Your request is been cancelled")
         else:
@@ -381,14 +948,13 @@ def post_request_details(intent,intent_dialogState,param_list,url,header_authori
 def on_session_started(session_started_request, session):
     """ Called when the session starts """
 
+    session_store.start(session)
     res = "\n ** on_session_started requestId= " + session_started_request['requestId'] + ", sessionId=" + session['sessionId']
     return res
 
 
-def on_launch(launch_request, session):
-    """ Called when the user launches the skill without specifying what they
-    want
-    """
+@responses.static_response
+def get_launch_response():
     session_attributes = {}
     should_end_session = False
     # Dispatch to your skill's launch
@@ -398,31 +964,135 @@ def on_launch(launch_request, session):
         "Welcome", speech_output, reprompt_text, should_end_session))
 
 
+def on_launch(launch_request, session):
+    """ Called when the user launches the skill without specifying what they
+    want
+    """
+    return get_launch_response()
+
+
+@responses.static_response
+def get_fallback_response():
+    """
+    This is method to answer requests for intents the skill does not handle.
+    """
+    card_title = "Fallback"
+    speech_output = "Sorry, I can't help with that. You can ask me for your leads or meetings, " \
+                    "or to create a lead or a meeting. "
+    reprompt_text = "You can ask me for your leads or meetings."
+    should_end_session = False
+    return build_response({}, build_speechlet_response(
+        card_title, speech_output, reprompt_text, should_end_session))
+
+
+def handle_fallback(intent_request, session, token_data):
+    return get_fallback_response()
+
+
+router = IntentRouter(fallback=handle_fallback)
+metrics.register_histogram_family('alexa_intent_seconds', 'Time spent in each intent handler.', router.latency)
+
+
+@router.intent("SugarCrmLeadRequestIntent", cacheable=True, requires_token=True)
+def handle_lead_request(intent_request, session, token_data):
+    return get_leads(intent_request['intent'], token_data.get("accessToken"))
+
+
+@router.intent("SugarCrmGetMeetingIntent", cacheable=True, requires_token=True)
+def handle_get_meeting(intent_request, session, token_data):
+    return get_meetings(intent_request['intent'], token_data.get("accessToken"))
+
+
+@router.intent("SugarCrmNextPageIntent", "AMAZON.NextIntent", cacheable=True, requires_token=True)
+def handle_next_page(intent_request, session, token_data):
+    cursor = next_page_cursor(session)
+    if cursor is None:
+        return get_no_more_results_response()
+    if cursor.get("intent") == "SugarCrmLeadRequestIntent":
+        return get_leads(intent_request['intent'], token_data.get("accessToken"), cursor.get("page", 1))
+    elif cursor.get("intent") == "SugarCrmGetMeetingIntent":
+        return get_meetings(intent_request['intent'], token_data.get("accessToken"), cursor.get("page", 1),
+                            cursor.get("date") or "")
+    return get_no_more_results_response()
+
+
+@router.intent("SugarCrmBriefingIntent", cacheable=True, requires_token=True)
+def handle_briefing(intent_request, session, token_data):
+    return get_briefing(intent_request['intent'], token_data.get("accessToken"))
+
+
+@router.intent("SugarCrmPostLeadIntent", mutating=True, requires_token=True)
+def handle_post_lead(intent_request, session, token_data):
+    return post_request_details(intent_request['intent'], intent_request.get("dialogState"), LEAD_POST_PARAMS,
+                                module_url('Leads'), token_data.get("accessToken"),'Leads',False, session)
+
+
+@router.intent("SugarCrmPostMeetingIntent", mutating=True, requires_token=True)
+def handle_post_meeting(intent_request, session, token_data):
+    return post_request_details(intent_request['intent'], intent_request.get("dialogState"), MEETING_POST_PARAMS,
+                                module_url('Meetings'), token_data.get("accessToken"), 'Meetings',True, session)
+
+
+@router.intent("AMAZON.HelpIntent")
+def handle_help(intent_request, session, token_data):
+    return get_help_response()
+
+
+@router.intent("AMAZON.CancelIntent", "AMAZON.StopIntent")
+def handle_stop(intent_request, session, token_data):
+    return handle_session_end_request()
+
+
+router.intent("AMAZON.FallbackIntent")(handle_fallback)
+
+
+def expired_token_response(intent_name, header_authorization_token, session=None):
+    """
+    Reject SuiteCRM intents whose access token has already expired before spending a round-trip on SuiteCRM.
+
+    :return: response asking the user to link their account again, or None when the request can proceed.
+    """
+    route = router.route(intent_name)
+    if route is not None and route.requires_token and \
+            tokens.is_expired(session_store.claims(session, header_authorization_token)):
+        return get_link_account_response()
+    return None
+
+
+def intent_deadline(intent_request):
+    """
+    Deadline of an intent request: Alexa's response budget counted from the request timestamp, shortened
+    to the intent's own timeout when its route has one.
+    """
+    route = router.route(intent_request['intent']['name'])
+    return deadline.request_deadline(intent_request.get('timestamp'), route.timeout if route is not None else None)
+
+
 def on_intent(intent_request, session,token_data={}):
     """ Called when the user specifies an intent for this skill """
-    intent = intent_request['intent']
-    intent_dialogState = intent_request.get("dialogState")
     intent_name = intent_request['intent']['name']
 
+    expired_response = expired_token_response(intent_name, token_data.get("accessToken"), session)
+    if expired_response is not None:
+        return expired_response
+
     # Dispatch to your skill's intent handlers
-    if intent_name == "SugarCrmLeadRequestIntent":
-        return get_leads(intent, token_data.get("accessToken"))
-    elif intent_name == "SugarCrmGetMeetingIntent":
-        return get_meetings(intent, token_data.get("accessToken"))
-    elif intent_name == "SugarCrmPostLeadIntent":
-        url = config.SUITE_CRM_INSTANCE_BASE_URL + '/api/v8/modules/Leads'
-        return post_request_details(intent, intent_dialogState, ['first_name', 'last_name', 'description'], url,
-                                    token_data.get("accessToken"),'Leads',False)
-    elif intent_name == "SugarCrmPostMeetingIntent":
-        url = config.SUITE_CRM_INSTANCE_BASE_URL + '/api/v8/modules/Meetings'
-        return post_request_details(intent, intent_dialogState, ['name','date', 'time', 'description','duration'], url,
-                                    token_data.get("accessToken"), 'Meetings',True)
-    elif intent_name == "AMAZON.HelpIntent":
-        return get_help_response()
-    elif intent_name == "AMAZON.CancelIntent" or intent_name == "AMAZON.StopIntent":
-        return handle_session_end_request()
-    else:
-        raise ValueError("Invalid intent")
+    route = router.route(intent_name)
+    deadline_token = deadline.set_deadline(intent_deadline(intent_request),
+                                           caps_calls=route is None or not route.mutating)
+    try:
+        return router.dispatch(intent_request, session, token_data)
+    finally:
+        deadline.reset_deadline(deadline_token)
+
+
+@responses.static_response
+def get_session_ended_response():
+    session_attributes = {}
+    should_end_session = True
+    output_text = "Thank you, Ending session here."
+    return build_response(session_attributes, build_speechlet_response(
+        'End session Intent', output_text, output_text, should_end_session))
 
 
 def on_session_ended(session_ended_request, session):
@@ -430,12 +1100,7 @@ def on_session_ended(session_ended_request, session):
 
     Is not called when the skill returns should_end_session=true
     """
-    session_attributes = {}
-    should_end_session = True
     print("@ on_session_ended requestId=" + session_ended_request['requestId'] +
           ", sessionId=" + session['sessionId'])
-    # add cleanup logic here
-    output_text = "Thank you, Ending session here."
-    return build_response(session_attributes, build_speechlet_response(
-        'End session Intent', output_text, output_text, should_end_session))
-
+    session_store.discard(session)
+    return get_session_ended_response()
@@ -0,0 +1,66 @@
+"""
+JSON codec used for Alexa requests/responses and SuiteCRM payloads.
+
+Parses straight from bytes and serializes to bytes, so request bodies and SuiteCRM responses never go
+through an intermediate str. The fastest installed backend is used: orjson, then ujson, then the stdlib.
+"""
+import json
+
+
+def _stdlib_codec():
+    encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(obj):
+        return encoder.encode(obj).encode('utf-8')
+
+    return loads, dumps
+
+
+def _orjson_codec():
+    import orjson
+    return orjson.loads, orjson.dumps
+
+
+def _ujson_codec():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+    return ujson.loads, dumps
+
+
+_BACKENDS = (
+    ('orjson', _orjson_codec),
+    ('ujson', _ujson_codec),
+    ('json', _stdlib_codec),
+)
+
+
+def get_codec(name):
+    """
+    Return the (loads, dumps) pair of a named backend. Raises ImportError when it isn't installed.
+    """
+    for backend_name, factory in _BACKENDS:
+        if backend_name == name:
+            return factory()
+    raise ValueError("Unknown JSON backend " + str(name))
+
+
+def available_backends():
+    names = []
+    for backend_name, factory in _BACKENDS:
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(backend_name)
+    return names
+
+
+BACKEND = available_backends()[0]
+# loads(data) parses bytes (preferred) or str; dumps(obj) returns compact UTF-8 encoded JSON bytes.
+loads, dumps = get_codec(BACKEND)
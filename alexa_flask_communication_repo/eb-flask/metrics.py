@@ -0,0 +1,244 @@
+"""
+In-process metrics: counters, latency histograms and timing spans, exposed in Prometheus text format.
+
+Recording a value costs a perf_counter() call, a bucket search and a lock, so instrumentation can stay on
+in production.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+
+# Upper bounds in seconds of latency histogram buckets, sized around Alexa's 8 second response budget.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 8.0)
+
+
+class Histogram(object):
+    """
+    Thread-safe histogram with fixed buckets, recording values such as request latencies.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """
+        :return: Dictionary with cumulative bucket counts keyed by upper bound ('+Inf' last), sum and count.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+            total_count = self._count
+        cumulative = []
+        running = 0
+        for upper_bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            cumulative.append((upper_bound, running))
+        return {"buckets": cumulative, "sum": total_sum, "count": total_count}
+
+    def quantile(self, q):
+        """
+        Estimate the q quantile (0 < q <= 1) as the upper bound of the bucket containing it.
+        """
+        snapshot = self.snapshot()
+        if not snapshot["count"]:
+            return 0.0
+        rank = q * snapshot["count"]
+        for upper_bound, cumulative_count in snapshot["buckets"]:
+            if cumulative_count >= rank:
+                return upper_bound
+        return float('inf')
+
+
+def _label_values(labels):
+    return labels if isinstance(labels, tuple) else (labels,)
+
+
+class HistogramFamily(object):
+    """
+    Histograms of one measurement, one per combination of label values (e.g. latency per intent name).
+
+    :param label_names: names of the labels, in the order their values are passed to observe()
+    """
+
+    def __init__(self, label_names=('label',), buckets=DEFAULT_BUCKETS):
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def labels(self, labels):
+        labels = _label_values(labels)
+        histogram = self._histograms.get(labels)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(labels, Histogram(self.buckets))
+        return histogram
+
+    def observe(self, labels, value):
+        self.labels(labels).observe(value)
+
+    def snapshot(self):
+        """
+        :return: Dictionary of histogram snapshots keyed by label value (or tuple of values).
+        """
+        with self._lock:
+            histograms = dict(self._histograms)
+        return dict((labels if len(labels) > 1 else labels[0], histogram.snapshot())
+                    for labels, histogram in histograms.items())
+
+    def collect(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+        return [(labels, histogram.snapshot()) for labels, histogram in histograms.items()]
+
+
+class CounterFamily(object):
+    """
+    Monotonic counters, one per combination of label values.
+    """
+
+    def __init__(self, label_names=()):
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        labels = _label_values(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(_label_values(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+# name -> (metric type, help text, HistogramFamily/CounterFamily or gauge callback)
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+    """
+    Register (or return the already registered) histogram family exposed as `name`.
+    """
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = ('histogram', help_text, HistogramFamily(label_names, buckets))
+        return _registry[name][2]
+
+
+def counter(name, help_text, label_names=()):
+    """
+    Register (or return the already registered) counter family exposed as `name`.
+    """
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = ('counter', help_text, CounterFamily(label_names))
+        return _registry[name][2]
+
+
+def register_histogram_family(name, help_text, family):
+    """
+    Expose an existing HistogramFamily, e.g. the per-intent latency of the router.
+    """
+    with _registry_lock:
+        _registry[name] = ('histogram', help_text, family)
+    return family
+
+
+def gauges(name, help_text, label_name, callback):
+    """
+    Expose the values of a stats callback as gauges, e.g. gauges('suitecrm_pool', ..., 'stat', pool_stats).
+
+    :param callback: function returning a dictionary of numeric values keyed by label value
+    """
+    with _registry_lock:
+        _registry[name] = ('gauge', help_text, (label_name, callback))
+
+
+class span(object):
+    """
+    Context manager timing a block into the `span_seconds` histogram.
+
+        with metrics.span('parse'):
+            event = json_codec.loads(data)
+    """
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        SPAN_SECONDS.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+SPAN_SECONDS = histogram('span_seconds', 'Time spent in each stage of request handling.', ('span',))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append('%s="%s"' % extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_bound(upper_bound):
+    return '+Inf' if upper_bound == float('inf') else repr(float(upper_bound))
+
+
+def render_prometheus():
+    """
+    Render every registered metric in the Prometheus text exposition format (version 0.0.4).
+
+    :return: bytes
+    """
+    with _registry_lock:
+        registry = sorted(_registry.items())
+    lines = []
+    for name, (metric_type, help_text, metric) in registry:
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        if metric_type == 'histogram':
+            for labels, snapshot in metric.collect():
+                for upper_bound, cumulative_count in snapshot['buckets']:
+                    lines.append('%s_bucket%s %d' % (name, _format_labels(metric.label_names, labels,
+                                                                          ('le', _format_bound(upper_bound))),
+                                                     cumulative_count))
+                label_text = _format_labels(metric.label_names, labels)
+                lines.append('%s_sum%s %r' % (name, label_text, float(snapshot['sum'])))
+                lines.append('%s_count%s %d' % (name, label_text, snapshot['count']))
+        elif metric_type == 'counter':
+            for labels, value in metric.collect():
+                lines.append('%s%s %r' % (name, _format_labels(metric.label_names, labels), float(value)))
+        else:
+            label_name, callback = metric
+            for label_value, value in sorted(callback().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append('%s%s %r' % (name, _format_labels((label_name,), (label_value,)), float(value)))
+    lines.append('')
+    return '\n'.join(lines).encode('utf-8')
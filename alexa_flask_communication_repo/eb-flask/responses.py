@@ -0,0 +1,77 @@
+"""
+Pre-serialized Alexa responses.
+
+Static responses (welcome, help, session end...) are built and serialized once and then served as cached
+bytes. Dynamic responses are plain dicts serialized once by serialize().
+"""
+import functools
+import json_codec
+import threading
+
+
+class PrerenderedResponse(dict):
+    """
+    Alexa response carrying its serialized JSON body in `body`.
+
+    Instances are shared between requests, so they are read-only; use copy() to get a modifiable dict.
+    """
+
+    __slots__ = ('body',)
+
+    def __init__(self, data, body=None):
+        dict.__init__(self, data)
+        self.body = body if body is not None else json_codec.dumps(data)
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("PrerenderedResponse is read-only, modify a copy() instead")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (PrerenderedResponse, (dict(self), self.body))
+
+
+def serialize(response):
+    """
+    Return the JSON body of a response, reusing the cached bytes of prerendered responses.
+    """
+    if isinstance(response, PrerenderedResponse):
+        return response.body
+    return json_codec.dumps(response)
+
+
+_static_builders = []
+
+
+def static_response(builder):
+    """
+    Decorator caching the prerendered result of a builder whose output never changes.
+
+    Arguments of the decorated function are ignored after the first call; warm_up() builds every
+    registered static response ahead of the first request.
+    """
+    cached = []
+    lock = threading.Lock()
+
+    @functools.wraps(builder)
+    def wrapper(*args, **kwargs):
+        if not cached:
+            with lock:
+                if not cached:
+                    cached.append(PrerenderedResponse(builder(*args, **kwargs)))
+        return cached[0]
+
+    _static_builders.append(wrapper)
+    return wrapper
+
+
+def warm_up():
+    """
+    Build and serialize every static response registered with static_response that takes no argument.
+
+    :return: number of static responses ready.
+    """
+    for wrapper in _static_builders:
+        wrapper()
+    return len(_static_builders)
+
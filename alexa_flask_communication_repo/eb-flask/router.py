@@ -0,0 +1,124 @@
+import asyncio
+import contextvars
+import functools
+import metrics
+import time
+
+
+class IntentRoute(object):
+    """
+    Handler of one intent with its metadata.
+
+    :param name: intent name
+    :param handler: callable(intent_request, session, token_data) returning the Alexa response
+    :param timeout: time budget of the intent in seconds, None for the default one
+    :param cacheable: True when the intent only reads data that may be served from cache
+    :param mutating: True when the intent creates or changes SuiteCRM records
+    :param requires_token: True when the intent calls SuiteCRM with the user's access token
+    """
+
+    __slots__ = ('name', 'handler', 'async_handler', 'timeout', 'cacheable', 'mutating', 'requires_token')
+
+    def __init__(self, name, handler, timeout=None, cacheable=False, mutating=False, requires_token=False):
+        self.name = name
+        self.handler = handler
+        self.async_handler = None
+        self.timeout = timeout
+        self.cacheable = cacheable
+        self.mutating = mutating
+        self.requires_token = requires_token
+
+
+class IntentRouter(object):
+    """
+    Table-driven intent dispatcher.
+
+    Handlers are registered with the intent() decorator and looked up by intent name in a dict. Requests
+    for unknown intents are answered by the fallback handler. The latency of every dispatch is recorded
+    in a histogram per intent.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.routes = {}
+        self.latency = metrics.HistogramFamily(('intent',))
+        self._current = contextvars.ContextVar('intent_route', default=None)
+
+    def intent(self, *intent_names, **metadata):
+        """
+        Decorator registering a handler for one or more intent names.
+
+        :param intent_names: intent names answered by the handler
+        :param metadata: IntentRoute keyword arguments (timeout, cacheable, mutating, requires_token)
+        """
+        def register(handler):
+            for intent_name in intent_names:
+                self.routes[intent_name] = IntentRoute(intent_name, handler, **metadata)
+            return handler
+        return register
+
+    def async_intent(self, *intent_names):
+        """
+        Decorator registering a coroutine answering already registered intents in dispatch_async().
+        """
+        def register(handler):
+            for intent_name in intent_names:
+                self.routes[intent_name].async_handler = handler
+            return handler
+        return register
+
+    def route(self, intent_name):
+        return self.routes.get(intent_name)
+
+    def current_route(self):
+        """
+        :return: IntentRoute being dispatched in the current context, or None outside of a routed intent.
+        """
+        return self._current.get()
+
+    def dispatch(self, intent_request, session, token_data):
+        """
+        Call the handler registered for the requested intent.
+
+        :return: response of the handler
+        """
+        intent_name = intent_request['intent']['name']
+        route = self.routes.get(intent_name)
+        handler = route.handler if route is not None else self.fallback
+        started = time.perf_counter()
+        current_token = self._current.set(route)
+        try:
+            return handler(intent_request, session, token_data)
+        finally:
+            self._current.reset(current_token)
+            self.latency.observe(intent_name if route is not None else 'fallback', time.perf_counter() - started)
+
+    async def dispatch_async(self, intent_request, session, token_data):
+        """
+        Awaitable dispatch. Routes without a coroutine handler run their blocking handler in the default
+        executor when they call SuiteCRM, and inline otherwise.
+        """
+        intent_name = intent_request['intent']['name']
+        route = self.routes.get(intent_name)
+        started = time.perf_counter()
+        current_token = self._current.set(route)
+        try:
+            if route is None:
+                return self.fallback(intent_request, session, token_data)
+            if route.async_handler is not None:
+                return await route.async_handler(intent_request, session, token_data)
+            if route.requires_token:
+                # Run in a copy of the current context so the handler sees the request's deadline and route.
+                loop = asyncio.get_event_loop()
+                return await loop.run_in_executor(None, functools.partial(
+                    contextvars.copy_context().run, route.handler, intent_request, session, token_data))
+            return route.handler(intent_request, session, token_data)
+        finally:
+            self._current.reset(current_token)
+            self.latency.observe(intent_name if route is not None else 'fallback', time.perf_counter() - started)
+
+    def latency_stats(self):
+        """
+        :return: Dictionary of latency histogram snapshots keyed by intent name.
+        """
+        return self.latency.snapshot()
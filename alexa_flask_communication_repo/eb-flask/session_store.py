@@ -0,0 +1,124 @@
+"""
+State kept between the turns of an Alexa session, keyed by sessionId.
+
+A session's state holds the decoded claims of its access token and the slot values collected so far by
+the create dialogs, so later turns don't decode the token again and the final turn can fall back on slots
+filled earlier. States expire SESSION_STORE_TTL seconds after their last change and are dropped when the
+session ends.
+"""
+import cache_backend
+import config
+import tokens
+
+
+def state_to_json(state):
+    if state.get('claims') is None:
+        return state
+    return dict(state, claims=tokens.claims_to_json(state['claims']))
+
+
+def state_from_json(data):
+    if data.get('claims') is None:
+        return data
+    return dict(data, claims=tokens.claims_from_json(data['claims']))
+
+
+_sessions = cache_backend.make_cache('sessions', max_entries=config.SESSION_STORE_MAX_ENTRIES,
+                                     max_bytes=config.SESSION_STORE_MAX_BYTES,
+                                     backend_name=config.SESSION_STORE_BACKEND, encode=state_to_json,
+                                     decode=state_from_json)
+
+
+def session_id(session):
+    return (session or {}).get('sessionId')
+
+
+def load(session):
+    """
+    :param session: session object of an Alexa request
+    :return: state of the session (a dictionary), empty when the session has none yet.
+    """
+    key = session_id(session)
+    if key is None:
+        return {}
+    return _sessions.get(key) or {}
+
+
+def save(session, state):
+    key = session_id(session)
+    if key is not None:
+        _sessions.set(key, state, config.SESSION_STORE_TTL)
+
+
+def discard(session):
+    key = session_id(session)
+    if key is not None:
+        _sessions.delete(key)
+
+
+def start(session):
+    """
+    Create the state of a new session, decoding its access token up front.
+    """
+    state = {}
+    token = (session.get('user') or {}).get('accessToken')
+    claims = tokens.introspect(token)
+    if claims is not None:
+        state['token_key'] = tokens.token_key(token)
+        state['claims'] = claims
+    save(session, state)
+    return state
+
+
+def claims(session, header_authorization_token):
+    """
+    Claims of the session's access token, decoded once per session.
+
+    :return: TokenClaims, or None when the token is missing or can't be decoded.
+    """
+    if not header_authorization_token:
+        return None
+    state = load(session)
+    key = tokens.token_key(header_authorization_token)
+    if state.get('token_key') == key:
+        return state['claims']
+    found = tokens.introspect(header_authorization_token)
+    if found is not None and session_id(session) is not None:
+        state['token_key'] = key
+        state['claims'] = found
+        save(session, state)
+    return found
+
+
+def remember_slots(session, intent):
+    """
+    Keep the slot values filled so far in a dialog, merged with those of its earlier turns.
+
+    :return: Dictionary of every slot value collected so far for the intent.
+    """
+    state = load(session)
+    slots = dict(state.get('slots', {}).get(intent.get('name')) or {})
+    for name, slot in (intent.get('slots') or {}).items():
+        if slot.get('value') is not None:
+            slots[name] = slot.get('value')
+    if session_id(session) is not None:
+        state.setdefault('slots', {})[intent.get('name')] = slots
+        save(session, state)
+    return slots
+
+
+def remembered_slots(session, intent_name):
+    return load(session).get('slots', {}).get(intent_name) or {}
+
+
+def forget_slots(session, intent_name):
+    """
+    Drop the slot values of a finished dialog so the next dialog of the same intent starts empty.
+    """
+    state = load(session)
+    if state.get('slots', {}).pop(intent_name, None) is not None:
+        save(session, state)
+
+
+def stats():
+    return _sessions.stats()
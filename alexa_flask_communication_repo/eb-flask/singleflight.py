@@ -0,0 +1,107 @@
+"""
+Suppression of duplicate concurrent calls.
+
+While a call for a key is in flight, other callers asking for the same key wait for its result instead of
+making the same call again. SingleFlight does this for threads, AsyncSingleFlight for the coroutines of an
+event loop.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight(object):
+    """
+    Group of calls deduplicated by key, e.g.
+
+        _exchanges = SingleFlight()
+        result = _exchanges.do((username, client_id), exchange_token, payload)
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, timeout=None, **kwargs):
+        """
+        Return fn(*args, **kwargs), or the result of the identical call already in flight for key.
+
+        Exceptions are raised to every caller sharing the call. Nothing is kept once the call returns.
+
+        :param timeout: seconds to wait for a call made by another caller, e.g. the time left before the
+                        caller's deadline when the call in flight may have none. Waits as long as it takes
+                        when None.
+        :raises: concurrent.futures.TimeoutError when the call in flight doesn't return within timeout.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result(timeout=None if timeout is None else max(timeout, 0))
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    def stats(self):
+        """
+        :return: Dictionary with the number of calls made, calls coalesced into them and calls in flight.
+        """
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight(object):
+    """
+    SingleFlight for coroutine functions, used from a single event loop, e.g.
+
+        _reads = AsyncSingleFlight()
+        rows = await _reads.do(url, fetch_rows, url)
+
+    The call runs as a task of its own, so a caller being cancelled doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args, timeout=None, **kwargs):
+        """
+        Return await fn(*args, **kwargs), or the result of the identical call already in flight for key.
+
+        :param timeout: seconds to wait for the call, unlimited when None. The call goes on for the other
+                        callers when one of them times out.
+        :raises: asyncio.TimeoutError when the call doesn't return within timeout.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        if timeout is None:
+            return await asyncio.shield(task)
+        return await asyncio.wait_for(asyncio.shield(task), max(timeout, 0))
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved when every caller was cancelled before the call ended.
+            task.exception()
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
@@ -0,0 +1,290 @@
+import circuit_breaker
+import config
+import deadline
+import metrics
+import os
+import re
+import threading
+import time
+from requests import Request, RequestException, Session
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+
+_stats_lock = threading.Lock()
+_pool_stats = {
+    "requests": 0,
+    "pool_misses": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+
+
+def _record_checkout(wait_seconds):
+    with _stats_lock:
+        _pool_stats["requests"] += 1
+        _pool_stats["wait_seconds_total"] += wait_seconds
+        if wait_seconds > _pool_stats["wait_seconds_max"]:
+            _pool_stats["wait_seconds_max"] = wait_seconds
+
+
+def _record_new_connection():
+    with _stats_lock:
+        _pool_stats["pool_misses"] += 1
+
+
+class _CountingPoolMixin(object):
+    """
+    Counts connection checkouts of a urllib3 pool.
+
+    Every checkout goes through _get_conn; a checkout that finds no idle connection calls _new_conn,
+    so hits are checkouts minus new connections.
+    """
+
+    def _get_conn(self, timeout=None):
+        started = time.perf_counter()
+        conn = super(_CountingPoolMixin, self)._get_conn(timeout=timeout)
+        _record_checkout(time.perf_counter() - started)
+        return conn
+
+    def _new_conn(self):
+        _record_new_connection()
+        return super(_CountingPoolMixin, self)._new_conn()
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class DeadlineAwareRetry(Retry):
+    """
+    Retry that gives up, instead of sleeping and retrying, once the current Alexa request has less than
+    config.SUITE_CRM_MIN_FETCH_BUDGET seconds left.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        time_left = deadline.remaining()
+        if time_left is not None and time_left < config.SUITE_CRM_MIN_FETCH_BUDGET:
+            raise MaxRetryError(_pool, url, error or ResponseError("no time left to retry"))
+        return super(DeadlineAwareRetry, self).increment(method, url, response=response, error=error,
+                                                         _pool=_pool, _stacktrace=_stacktrace)
+
+
+def _build_retry():
+    """
+    Retry policy for SuiteCRM calls: connection errors and 5xx/429 answers are retried with backoff,
+    but only for idempotent GET requests so a POST/PATCH is never sent twice.
+    """
+    retry_kwargs = {
+        "total": config.SUITE_CRM_MAX_RETRIES,
+        "connect": config.SUITE_CRM_MAX_RETRIES,
+        "read": config.SUITE_CRM_MAX_RETRIES,
+        "status": config.SUITE_CRM_MAX_RETRIES,
+        "backoff_factor": config.SUITE_CRM_RETRY_BACKOFF_FACTOR,
+        "status_forcelist": (429, 500, 502, 503, 504),
+        "raise_on_status": False,
+    }
+    try:
+        return DeadlineAwareRetry(allowed_methods=frozenset(["GET"]), **retry_kwargs)
+    except TypeError:
+        # urllib3 < 1.26 names the option method_whitelist.
+        return DeadlineAwareRetry(method_whitelist=frozenset(["GET"]), **retry_kwargs)
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pools report hit/miss and wait-time counters.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Return the process wide requests session used for all SuiteCRM traffic.
+
+    The session keeps connections to SuiteCRM alive between Alexa requests, so the TCP and TLS
+    handshakes are paid once per pooled connection instead of once per call.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = Session()
+                adapter = PooledHTTPAdapter(pool_connections=config.SUITE_CRM_POOL_CONNECTIONS,
+                                            pool_maxsize=config.SUITE_CRM_POOL_MAXSIZE,
+                                            pool_block=config.SUITE_CRM_POOL_BLOCK,
+                                            max_retries=_build_retry())
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _forget_parent_session():
+    """
+    Run in a forked child: drop the session inherited from the parent without closing it, as its pooled
+    sockets are still the parent's. The child opens its own on first use.
+    """
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_parent_session)
+
+
+def close_session():
+    """
+    Close every pooled connection. The next call opens a fresh session.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def preconnect(url, count):
+    """
+    Open up to `count` pooled connections to the host of url ahead of the first call, e.g. when a worker starts.
+
+    Stops at the first connection that can't be opened: SuiteCRM being down must not keep a worker from starting.
+
+    :return: number of connections opened.
+    """
+    session = get_session()
+    adapter = session.get_adapter(url)
+    try:
+        # requests >= 2.32 keys pools by TLS settings too, so ask for the pool a request to url would use.
+        verify = session.merge_environment_settings(url, {}, None, None, None)["verify"]
+        pool = adapter.get_connection_with_tls_context(Request("GET", url).prepare(), verify)
+    except AttributeError:
+        pool = adapter.get_connection(url)
+    conns = [pool._get_conn() for _ in range(min(count, config.SUITE_CRM_POOL_MAXSIZE))]
+    opened = 0
+    failed = False
+    for conn in conns:
+        if not failed:
+            try:
+                conn.timeout = config.SUITE_CRM_CONNECT_TIMEOUT
+                conn.connect()
+                opened += 1
+            except Exception:
+                failed = True
+        if failed:
+            conn.close()
+            conn = None
+        pool._put_conn(conn)
+    return opened
+
+
+def default_timeout():
+    return (config.SUITE_CRM_CONNECT_TIMEOUT, config.SUITE_CRM_READ_TIMEOUT)
+
+
+SUITE_CRM_REQUEST_SECONDS = metrics.histogram('suitecrm_request_seconds', 'Latency of calls made to SuiteCRM.',
+                                              ('module', 'method', 'status'))
+_ENDPOINT_PATTERN = re.compile(r'/api/v8/modules/(\w+)|/api/(oauth)/|/service/v4_1/(rest)')
+
+
+def endpoint_module(url):
+    """
+    Name of the SuiteCRM module (or 'oauth'/'rest' endpoint) a URL points at, used as metrics label.
+    """
+    match = _ENDPOINT_PATTERN.search(url)
+    if match is None:
+        return 'other'
+    return match.group(1) or match.group(2) or match.group(3)
+
+
+def record_call(method, url, status, seconds):
+    SUITE_CRM_REQUEST_SECONDS.observe((endpoint_module(url), method, status), seconds)
+
+
+# Errors meaning SuiteCRM could not answer in time: the caller may fall back to cached data.
+UNAVAILABLE_ERRORS = (RequestException, deadline.DeadlineExceeded, circuit_breaker.CircuitOpenError)
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request to SuiteCRM through the shared connection pool.
+
+    The timeout defaults to config's timeouts capped at the time left for the current Alexa request, and
+    calls to an endpoint whose circuit breaker is open are rejected without being sent. A call timing out
+    because that deadline passed doesn't count as a failure of the endpoint.
+
+    :param method: HTTP method i.e GET/POST/PATCH
+    :param url: request URL
+    :param kwargs: extra arguments passed to requests (headers, data, timeout...)
+
+    :return: requests.Response object
+    :raises: one of UNAVAILABLE_ERRORS when SuiteCRM can't be called or doesn't answer in time
+    """
+    kwargs.setdefault("timeout", deadline.call_timeout(default_timeout()))
+    breaker = circuit_breaker.get_breaker(endpoint_module(url))
+    breaker.check()
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        response = get_session().request(method, url, **kwargs)
+        status = str(response.status_code)
+    except BaseException as e:
+        # Read timeouts come wrapped by the retries, so any error ending past a capped deadline counts as cut short.
+        if isinstance(e, RequestException) and deadline.caps_calls() and deadline.expired():
+            breaker.release()
+        else:
+            breaker.record_failure()
+        raise
+    finally:
+        record_call(method, url, status, time.perf_counter() - started)
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return request("PATCH", url, **kwargs)
+
+
+def pool_stats():
+    """
+    Snapshot of the connection pool counters.
+
+    :return: Dictionary with checkouts, hits, misses and the total/max seconds spent waiting for a connection.
+    """
+    with _stats_lock:
+        stats = dict(_pool_stats)
+    stats["pool_hits"] = max(stats["requests"] - stats["pool_misses"], 0)
+    return stats
+
+
+metrics.gauges('suitecrm_pool', 'SuiteCRM connection pool counters (see suitecrm_client.pool_stats).', 'stat', pool_stats)
+metrics.gauges('suitecrm_circuit_open', 'SuiteCRM endpoints whose circuit breaker is open (1) or not (0).', 'endpoint',
+               circuit_breaker.open_circuits)
@@ -0,0 +1,117 @@
+"""
+Query builder of SuiteCRM v8 (JSON:API) module listings.
+
+Fields, filters, sorting and paging are sent to SuiteCRM so it only returns what the skill speaks, and the
+records of the answer are projected straight into tuples of the requested fields, e.g.
+
+    query = Query('Meetings').fields('name', 'date_start').starts_with('date_start', '2018-08-03').page(1, 5)
+    call_suitecrm_api(query, 'GET', token)
+"""
+import config
+from urllib.parse import quote
+
+
+class Query(object):
+    """
+    Listing query of one SuiteCRM module. Builder methods return the query itself so calls can be chained.
+
+    :param module_name: SuiteCRM module, e.g. Leads
+    """
+
+    __slots__ = ('module_name', 'field_names', 'filters', 'sort_fields', 'page_number', 'page_size')
+
+    def __init__(self, module_name):
+        self.module_name = module_name
+        self.field_names = ()
+        self.filters = []
+        self.sort_fields = ()
+        self.page_number = None
+        self.page_size = None
+
+    def fields(self, *field_names):
+        """
+        Only return these attributes (JSON:API sparse fieldset); rows hold them in this order.
+        """
+        self.field_names = tuple(field_names)
+        return self
+
+    def filter(self, field_name, value, operator='eq'):
+        """
+        Keep records whose field matches value, e.g. filter('status', 'New') or filter('name', 'A%', 'li').
+
+        :param operator: SuiteCRM filter operator (eq, neq, gt, gte, lt, lte, li for LIKE patterns)
+        """
+        self.filters.append((field_name, operator, value))
+        return self
+
+    def starts_with(self, field_name, prefix):
+        """
+        Keep records whose field starts with prefix, e.g. the meetings of a day: starts_with('date_start', '2018-08-03').
+        """
+        return self.filter(field_name, "{0}%".format(prefix), 'li')
+
+    def sort(self, *field_names):
+        """
+        Order records by these fields, a field prefixed with '-' in descending order.
+        """
+        self.sort_fields = tuple(field_names)
+        return self
+
+    def page(self, number=1, size=None):
+        """
+        Return one page of records.
+
+        :param number: page number, starting at 1
+        :param size: records per page, config.SUITE_CRM_PAGE_SIZE of the module by default
+        """
+        self.page_number = number
+        self.page_size = size if size is not None else config.SUITE_CRM_PAGE_SIZE.get(self.module_name, 5)
+        return self
+
+    def params(self):
+        """
+        :return: list of (name, value) query string parameters, not encoded.
+        """
+        params = []
+        if self.page_number is not None:
+            params.append(("page[size]", str(self.page_size)))
+            params.append(("page[number]", str(self.page_number)))
+        for field_name, operator, value in self.filters:
+            params.append(("filter[{0}.{1}]".format(self.module_name, field_name),
+                           str(value) if operator == 'eq' else "[[{0}]]{1}".format(operator, value)))
+        if self.sort_fields:
+            params.append(("sort", ",".join(self.sort_fields)))
+        if self.field_names:
+            params.append(("fields[{0}]".format(self.module_name), ",".join(self.field_names)))
+        return params
+
+    def query_string(self):
+        # Brackets are left as SuiteCRM's own URLs write them (page[size]=..., filter[...]=[[li]]...).
+        return "&".join(quote(name, safe='.[]') + "=" + quote(value, safe=',[]')
+                        for name, value in self.params())
+
+    def url(self, base_url=None):
+        """
+        :param base_url: SuiteCRM base URL, config.SUITE_CRM_INSTANCE_BASE_URL by default
+        :return: encoded URL of the listing
+        """
+        if base_url:
+            url = base_url + "/api/v8/modules/" + self.module_name
+        else:
+            url = config.SUITE_CRM_INSTANCE_MODULES_URL + self.module_name
+        query_string = self.query_string()
+        return url + "?" + query_string if query_string else url
+
+    def __repr__(self):
+        return "Query({0!r})".format(self.url())
+
+
+def project_rows(records, field_names):
+    """
+    Project the attributes of JSON:API records into tuples of the requested fields (None when missing).
+
+    :param records: data member of a listing answer
+    :param field_names: fields kept, in order
+    :return: list of tuples
+    """
+    return [tuple(map((record.get("attributes") or {}).get, field_names)) for record in records]
@@ -0,0 +1,131 @@
+import cache_backend
+import config
+import hashlib
+import suitecrm_client
+import time
+from collections import namedtuple
+
+
+TokenClaims = namedtuple('TokenClaims', ['sub', 'exp', 'payload'])
+
+def claims_to_json(claims):
+    return claims._asdict()
+
+
+def claims_from_json(data):
+    return TokenClaims(**data)
+
+
+_token_cache = cache_backend.make_cache('tokens', max_entries=config.TOKEN_CACHE_MAX_ENTRIES, max_bytes=16 * 1024 * 1024,
+                                        backend_name=config.TOKEN_CACHE_BACKEND, encode=claims_to_json,
+                                        decode=claims_from_json)
+# Hashes of the tokens SuiteCRM has accepted (see verify).
+_verified_tokens = cache_backend.make_cache('verified_tokens', max_entries=config.TOKEN_CACHE_MAX_ENTRIES,
+                                            backend_name=config.TOKEN_CACHE_BACKEND)
+
+
+class TokenRejected(Exception):
+    """
+    Raised when SuiteCRM refuses an access token.
+    """
+
+
+def token_key(header_authorization_token):
+    return hashlib.sha256(str(header_authorization_token).encode('utf-8')).hexdigest()
+
+
+def introspect(header_authorization_token):
+    """
+    Decode the claims of a SuiteCRM access token without verifying its signature (SuiteCRM does that).
+
+    Decoded claims are cached by a hash of the token until the token expires, so a token is decoded once
+    however many requests and CRM calls it is used for.
+
+    :param header_authorization_token: accessToken from session.user
+    :return: TokenClaims, or None when the token is missing or can't be decoded.
+    """
+    if not header_authorization_token:
+        return None
+    key = token_key(header_authorization_token)
+    claims = _token_cache.get(key)
+    if claims is not None:
+        return claims
+    # jwt is imported by the warm-up (see warmup.py), or by the first token missing the cache without one.
+    import jwt
+    try:
+        payload = jwt.decode(header_authorization_token, verify=False)
+    except Exception:
+        return None
+    if not payload:
+        return None
+    claims = TokenClaims(payload.get('sub'), payload.get('exp'), payload)
+    ttl = token_ttl(claims)
+    if ttl > 0:
+        _token_cache.set(key, claims, ttl)
+    return claims
+
+
+def subject(header_authorization_token):
+    """
+    Return the SuiteCRM user id ('sub' claim) of an access token, or None when it can't be decoded.
+    """
+    claims = introspect(header_authorization_token)
+    return claims.sub if claims is not None else None
+
+
+def token_ttl(claims):
+    """
+    Seconds the claims of a token may be kept: config.TOKEN_CACHE_MAX_TTL, never past the token's expiry.
+    """
+    ttl = config.TOKEN_CACHE_MAX_TTL
+    if claims.exp is not None:
+        ttl = min(ttl, claims.exp - time.time())
+    return ttl
+
+
+def is_verified(header_authorization_token):
+    return bool(header_authorization_token) and _verified_tokens.get(token_key(header_authorization_token)) is not None
+
+
+def verify(header_authorization_token, check_url):
+    """
+    Have SuiteCRM check an access token whose claims are trusted without the token itself reaching SuiteCRM,
+    e.g. the user id of records created by the write batcher under its service user. introspect() doesn't
+    check signatures, so a forged token could otherwise claim any user. Accepted tokens are remembered until
+    they expire, so a token costs one check.
+
+    :param header_authorization_token: accessToken from session.user
+    :param check_url: URL of a cheap GET the token's user is allowed to make, e.g. one record of a module
+    :raises: TokenRejected when SuiteCRM refuses the token, one of suitecrm_client.UNAVAILABLE_ERRORS (or
+             requests.HTTPError) when it can't tell.
+    """
+    if is_verified(header_authorization_token):
+        return
+    claims = introspect(header_authorization_token)
+    if claims is None:
+        raise TokenRejected("Access token can't be decoded")
+    suitecrm_response = suitecrm_client.get(check_url, headers={
+        "Accept": "application/vnd.api+json",
+        "Authorization": "Bearer " + str(header_authorization_token)
+    })
+    if suitecrm_response.status_code in (401, 403):
+        raise TokenRejected("SuiteCRM refused the access token")
+    suitecrm_response.raise_for_status()
+    ttl = token_ttl(claims)
+    if ttl > 0:
+        _verified_tokens.set(token_key(header_authorization_token), True, ttl)
+
+
+def is_expired(claims, leeway=None):
+    """
+    Check the 'exp' claim, treating tokens expiring within the next `leeway` seconds as expired.
+    """
+    if claims is None or claims.exp is None:
+        return False
+    if leeway is None:
+        leeway = config.TOKEN_EXPIRY_LEEWAY
+    return claims.exp <= time.time() + leeway
+
+
+def cache_stats():
+    return _token_cache.stats()
@@ -0,0 +1,80 @@
+"""
+Work done once when a worker starts, so the first Alexa requests it serves don't pay for it.
+
+Warm-up builds the static responses, imports the modules left out of startup that nearly every request
+ends up needing (jwt, to decode access tokens) and opens pooled connections to SuiteCRM. isodate, only used
+to create meetings, is still imported by its first use.
+
+Connections belong to the process that opened them: a process forked after warm-up, e.g. a gunicorn worker of
+a --preload master, doesn't use its parent's (see suitecrm_client) and runs its own warm-up after the fork.
+"""
+import config
+import functools
+import importlib
+import metrics
+import os
+import responses
+import suitecrm_client
+import threading
+import time
+
+
+WARM_UP_MODULES = ('jwt',)
+
+_report = {}
+_fork_hook_registered = False
+
+
+def warm_up(connections=None):
+    """
+    Build the static responses, import WARM_UP_MODULES and open pooled connections to SuiteCRM.
+
+    :param connections: connections to open, config.WARM_UP_CONNECTIONS by default
+    :return: Dictionary with what was prepared and the seconds it took.
+    """
+    started = time.perf_counter()
+    report = {"static_responses": responses.warm_up()}
+    for module_name in WARM_UP_MODULES:
+        importlib.import_module(module_name)
+    report["modules"] = len(WARM_UP_MODULES)
+    if connections is None:
+        connections = config.WARM_UP_CONNECTIONS
+    report["connections"] = suitecrm_client.preconnect(config.SUITE_CRM_INSTANCE_BASE_URL, connections) if connections else 0
+    report["seconds"] = time.perf_counter() - started
+    update_report(**report)
+    return report
+
+
+def start(mode=None):
+    """
+    Warm the worker up according to config.WARM_UP_MODE, now and again in every process forked from it.
+
+    :return: the warm-up thread in "background" mode, None otherwise.
+    """
+    global _fork_hook_registered
+    mode = mode or config.WARM_UP_MODE
+    if mode == "off":
+        return None
+    if not _fork_hook_registered and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=functools.partial(start, mode))
+        _fork_hook_registered = True
+    if mode == "background":
+        thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+    warm_up()
+    return None
+
+
+def update_report(**values):
+    _report.update(values)
+
+
+def report():
+    """
+    :return: what the last warm-up prepared and how long it took, empty before any warm-up.
+    """
+    return dict(_report)
+
+
+metrics.gauges('warm_up', 'What the last warm-up of this worker prepared and the seconds it took.', 'stat', report)
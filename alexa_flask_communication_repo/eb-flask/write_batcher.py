@@ -0,0 +1,240 @@
+"""
+Batched creation of SuiteCRM records.
+
+Creates of one module are queued and sent together as a single v4_1 REST `set_entries` call, flushed once
+config.SUITE_CRM_WRITE_BATCH_SIZE records are waiting or config.SUITE_CRM_WRITE_BATCH_DELAY seconds after
+the first one was queued. Every queued create gets a future resolved with its own result, shaped like the
+v8 API answer to a POST so post_request_details handles both the same way.
+
+Batched records are created by the service user, so the user's access token never reaches SuiteCRM with
+them: callers have SuiteCRM check the token first (tokens.verify) before trusting its user id.
+"""
+import config
+import hashlib
+import json_codec
+import metrics
+import suitecrm_client
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+WRITE_BATCHES = metrics.counter('suitecrm_write_batches_total', 'set_entries calls sent by the write batcher.',
+                                ('module',))
+BATCHED_RECORDS = metrics.counter('suitecrm_batched_records_total', 'Records created through the write batcher.',
+                                  ('module',))
+
+# v4_1 error number answered for an unknown or expired session id.
+INVALID_SESSION_ID = "11"
+
+
+class RestApiError(Exception):
+    """
+    Error answered by the v4_1 REST API.
+    """
+
+
+class CreatePending(Exception):
+    """
+    Raised when a queued create is still waiting for its batch at the caller's deadline. The batch will
+    still send it, so it must not be submitted again.
+    """
+
+
+def rest_call(method, rest_data):
+    """
+    Call a method of the v4_1 REST API.
+
+    :param method: name of the API method, e.g. login or set_entries
+    :param rest_data: Dictionary of the method arguments
+    :return: decoded JSON answer
+    """
+    suitecrm_response = suitecrm_client.post(config.SUITE_CRM_INSTANCE_REST_URL, data={
+        "method": method,
+        "input_type": "JSON",
+        "response_type": "JSON",
+        "rest_data": json_codec.dumps(rest_data),
+    })
+    result = json_codec.loads(suitecrm_response.content)
+    if isinstance(result, dict) and result.get("number") and result.get("name"):
+        raise RestApiError(str(result.get("number")), result.get("description") or result.get("name"))
+    return result
+
+
+_session_id = None
+_session_lock = threading.Lock()
+
+
+def session_id():
+    """
+    Return the v4_1 session id of the service user, logging in on first use.
+    """
+    global _session_id
+    with _session_lock:
+        if _session_id is None:
+            password = hashlib.md5(config.SUITE_CRM_SERVICE_USER_PASSWORD.encode('utf-8')).hexdigest()
+            result = rest_call("login", {
+                "user_auth": {"user_name": config.SUITE_CRM_SERVICE_USER_NAME, "password": password},
+                "application_name": "alexa-skill",
+                "name_value_list": [],
+            })
+            _session_id = result.get("id")
+        return _session_id
+
+
+def forget_session(expired_session_id):
+    global _session_id
+    with _session_lock:
+        if _session_id == expired_session_id:
+            _session_id = None
+
+
+def set_entries(module_name, attribute_dicts):
+    """
+    Create records with one set_entries call, logging in again once if the session expired.
+
+    :return: list of the created record ids, in the order of attribute_dicts ('' for a record not created)
+    """
+    name_value_lists = [[{"name": name, "value": value} for name, value in attributes.items()]
+                        for attributes in attribute_dicts]
+    for attempt in range(2):
+        current_session_id = session_id()
+        try:
+            result = rest_call("set_entries", {"session": current_session_id, "module_name": module_name,
+                                               "name_value_lists": name_value_lists})
+        except RestApiError as e:
+            if e.args[0] != INVALID_SESSION_ID or attempt:
+                raise
+            forget_session(current_session_id)
+        else:
+            return result.get("ids") or []
+
+
+def created_record(module_name, record_id, attributes):
+    """
+    Result of one batched create, in the format of the v8 API answer to a POST.
+    """
+    if not record_id:
+        return {"errors": True, "message": "SuiteCRM did not create the record"}
+    return {
+        "data": {
+            "type": module_name,
+            "id": record_id,
+            "attributes": attributes,
+            "relationships": {
+                "assigned_user_link": {"links": {"related": "{0}{1}/{2}/relationships/assigned_user_link"
+                                                             .format(config.SUITE_CRM_INSTANCE_MODULES_URL, module_name, record_id)}}
+            },
+        }
+    }
+
+
+_flush_executor = None
+_flush_executor_lock = threading.Lock()
+
+
+def get_flush_executor():
+    """
+    Return the thread pool sending full batches, kept apart from the background pool.
+    """
+    global _flush_executor
+    if _flush_executor is None:
+        with _flush_executor_lock:
+            if _flush_executor is None:
+                _flush_executor = ThreadPoolExecutor(max_workers=config.SUITE_CRM_WRITE_BATCH_WORKERS)
+    return _flush_executor
+
+
+class WriteBatcher(object):
+    """
+    Queue of pending creates of one module.
+
+    :param module_name: SuiteCRM module of the records
+    :param max_batch_size: number of waiting records triggering a flush
+    :param max_delay: seconds after the first queued record at which the batch is flushed anyway
+    """
+
+    def __init__(self, module_name, max_batch_size, max_delay):
+        self.module_name = module_name
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def submit(self, attributes):
+        """
+        Queue the creation of one record.
+
+        :param attributes: Dictionary of the record attributes
+        :return: concurrent.futures.Future resolved with the result of the create (see created_record)
+        """
+        future = Future()
+        with self._lock:
+            self._pending.append((attributes, future))
+            if len(self._pending) >= self.max_batch_size:
+                batch = self._take()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if batch:
+            get_flush_executor().submit(self._send, batch)
+        return future
+
+    def flush(self):
+        """
+        Send every waiting record now.
+        """
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _send(self, batch):
+        WRITE_BATCHES.inc(self.module_name)
+        try:
+            record_ids = set_entries(self.module_name, [attributes for attributes, future in batch])
+        except Exception as e:
+            for attributes, future in batch:
+                future.set_exception(e)
+            return
+        BATCHED_RECORDS.inc(self.module_name, len(batch))
+        for index, (attributes, future) in enumerate(batch):
+            record_id = record_ids[index] if index < len(record_ids) else None
+            future.set_result(created_record(self.module_name, record_id, attributes))
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(module_name):
+    batcher = _batchers.get(module_name)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.get(module_name)
+            if batcher is None:
+                batcher = _batchers[module_name] = WriteBatcher(module_name, config.SUITE_CRM_WRITE_BATCH_SIZE,
+                                                                config.SUITE_CRM_WRITE_BATCH_DELAY)
+    return batcher
+
+
+def submit_create(module_name, param_key_val_dict, user_db_id=None):
+    """
+    Queue the creation of a record assigned to the user.
+
+    :return: concurrent.futures.Future resolved with the result of the create
+    """
+    attributes = dict(param_key_val_dict)
+    if user_db_id:
+        attributes["assigned_user_id"] = user_db_id
+    return get_batcher(module_name).submit(attributes)